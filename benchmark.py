@@ -0,0 +1,277 @@
+"""
+Benchmarks of the real game code under the SDL dummy drivers.
+
+    python benchmark.py                          run every scenario, print a table
+    python benchmark.py --save baseline.json     keep the results
+    python benchmark.py --compare baseline.json  show the change against them
+
+Every scenario runs twice: once to time the frame stages and the sections
+inside them with the game's profiler, once under tracemalloc for the memory
+numbers (tracing slows everything down, so the two are not mixed). Results
+are JSON, timings in milliseconds per frame
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+os.environ['SDL_VIDEODRIVER'] = 'dummy'
+os.environ['SDL_AUDIODRIVER'] = 'dummy'
+
+import pygame
+
+from game import Game
+from scripts.enemy import Enemy
+from scripts.projectile import SHURIKEN
+from scripts.profiler import Profiler
+
+VERSION = 2
+INPUT_ACTIONS = ['left', 'right', 'jump', 'attack', 'dash']
+
+
+def random_input(game, rng, rate=0.2):
+    if rng.random() < rate:
+        action = rng.choice(INPUT_ACTIONS)
+        if action in ('left', 'right'):
+            game.apply_input(action, rng.random() < 0.5)
+        else:
+            game.apply_input(action)
+
+
+# keep the game on the scenario: nobody dies for good and the level never changes
+def keep_alive(game):
+    game.dead = 0
+    game.current_level_passed = False
+    game.transition = 0
+
+
+def clear_map(game):
+    tilemap = game.tilemap
+    tilemap.grid.clear()
+    tilemap.offgrid_tiles = []
+    tilemap.offgrid_index = None
+    tilemap.render_cache.invalidate_all()
+    game.enemies = []
+    game.leaf_spawners = []
+
+
+# a flat floor with some hills, from x0 to x1 (tiles)
+def build_floor(tilemap, x0, x1, y, rng):
+    for x in range(x0, x1):
+        tilemap.set_tile((x, y), 'grass', 1)
+        for depth in range(1, 4):
+            tilemap.set_tile((x, y + depth), 'stone', 8 if depth > 1 else 1)
+        if rng.random() < 0.1:
+            tilemap.set_tile((x, y - 1), 'grass', 1)
+
+
+def setup_level(game, rng):
+    def frame(i):
+        random_input(game, rng)
+    return frame
+
+
+def setup_huge_map(game, rng):
+    # 2048 x 48 tiles of ground, platforms and decor; the player runs right through all of it
+    tilemap = game.tilemap
+    clear_map(game)
+    build_floor(tilemap, -10, 2048, 12, rng)
+    for x in range(0, 2048, 7):
+        for dx in range(rng.randint(2, 5)):
+            tilemap.set_tile((x + dx, rng.randint(-20, 8)), 'stone', rng.randint(0, 8))
+        tilemap.add_offgrid({'type': 'decor', 'variant': rng.randint(0, 3), 'pos': [x * 16 + rng.random() * 16, 12 * 16 - 16]})
+        if x % 35 == 0:
+            tilemap.add_offgrid({'type': 'large_decor', 'variant': rng.randint(0, 2), 'pos': [x * 16.0, 12 * 16 - 31.0]})
+    game.player.pos = [0.0, 150.0]
+    game.player.prev_pos = [0.0, 150.0]
+
+    def frame(i):
+        keep_alive(game)
+        game.movement[1] = True
+        if i % 40 == 0:
+            game.apply_input('jump')
+    return frame
+
+
+def setup_enemies(game, rng, count=500):
+    clear_map(game)
+    build_floor(game.tilemap, -20, count * 2 + 20, 20, rng)
+    game.enemies = [Enemy(game, (x * 32.0, 20 * 16 - 15.0), (8, 15)) for x in range(count)]
+    game.player.pos = [count * 16.0, 20 * 16 - 40.0]
+    game.player.prev_pos = list(game.player.pos)
+
+    def frame(i):
+        keep_alive(game)
+        random_input(game, rng, rate=0.05)
+    return frame
+
+
+def setup_particle_storm(game, rng):
+    setup = setup_enemies(game, rng, count=200)
+    enemies = list(game.enemies)
+
+    def frame(i):
+        setup(i)
+        # every half second 20 enemies die at once, 30 sparks and particles each
+        if i % 30 == 0:
+            for enemy in rng.sample(enemies, 20):
+                enemy.hit()
+                game.player.hit()
+    return frame
+
+
+def setup_shuriken(game, rng):
+    setup = setup_enemies(game, rng, count=100)
+
+    def frame(i):
+        setup(i)
+        # 8 shuriken every frame in both directions; they live 360 steps, so thousands fly at once
+        player = game.player
+        for j in range(8):
+            game.projectiles.spawn(SHURIKEN, (player.pos[0] + rng.random() * 64 - 32, player.pos[1] + rng.random() * 12), rng.choice([-7.5, 7.5]))
+    return frame
+
+
+SCENARIOS = {
+    'level': (setup_level, 600),
+    'huge_map': (setup_huge_map, 900),
+    'enemies_500': (setup_enemies, 300),
+    'particle_storm': (setup_particle_storm, 300),
+    'shuriken_session': (setup_shuriken, 1800),
+}
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def run_scenario(name, frames, seed, trace=False):
+    setup, default_frames = SCENARIOS[name]
+    frames = frames or default_frames
+    # the stages and their sections are timed by the game's own profiler,
+    # it stays off during the memory pass so it does not count there
+    profiler = Profiler(history=not trace)
+    game = Game(headless=True, seed=seed, profiler=profiler)
+    rng = random.Random(seed)
+    hook = setup(game, rng)
+
+    frame_times = []
+    frame_peaks = []
+    projectiles_peak = 0
+    if trace:
+        tracemalloc.start()
+    for i in range(frames):
+        if trace:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        hook(i)
+        game.pipeline.run_frame()
+        frame_times.append(time.perf_counter() - start)
+        projectiles_peak = max(projectiles_peak, len(game.projectiles))
+        if trace:
+            # the most memory the frame held on top of what was there when it started:
+            # its temporary objects, not a count of every allocation it made
+            frame_peaks.append(tracemalloc.get_traced_memory()[1] - base)
+    if trace:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return {'frame_peak_kb': sum(frame_peaks) / len(frame_peaks) / 1024, 'peak_kb': peak / 1024}
+
+    # stages and the sections nested in them, e.g. render_world/tiles; a section
+    # missing from a frame took no time in it. Listed in pipeline order
+    order = [stage for stage, func in game.pipeline.stages]
+    paths = []
+    for frame in profiler.history:
+        paths.extend(path for path in frame if path not in paths)
+    paths.sort(key=lambda path: (order.index(path.split('/')[0]), path.count('/')))
+    stage_times = {path: [frame.get(path, 0) for frame in profiler.history] for path in paths}
+
+    return {
+        'frames': frames,
+        'frame_mean_ms': sum(frame_times) / frames * 1000,
+        'frame_p95_ms': percentile(frame_times, 0.95) * 1000,
+        'stages': {stage: {'mean_ms': sum(times) / frames * 1000, 'p95_ms': percentile(times, 0.95) * 1000}
+                   for stage, times in stage_times.items()},
+        'projectiles_peak': projectiles_peak,
+        'projectiles_dropped': game.projectiles.dropped,
+        'state_hash': game.state_hash(),
+    }
+
+
+def run(names, frames=None, seed=1, memory=True):
+    results = {'version': VERSION, 'python': platform.python_version(), 'pygame': pygame.version.ver,
+               'seed': seed, 'scenarios': {}}
+    for name in names:
+        result = run_scenario(name, frames, seed)
+        if memory:
+            result.update(run_scenario(name, frames, seed, trace=True))
+        results['scenarios'][name] = result
+    return results
+
+
+def print_results(results, baseline=None):
+    for name, result in results['scenarios'].items():
+        old = baseline['scenarios'].get(name) if baseline else None
+        print('%s: %d frames' % (name, result['frames']))
+        rows = [('frame', result['frame_mean_ms'], result['frame_p95_ms'], old and old['frame_mean_ms'])]
+        for stage, times in result['stages'].items():
+            old_stage = old and old['stages'].get(stage)
+            label = '  ' * (stage.count('/') + 1) + stage.rsplit('/', 1)[-1]
+            rows.append((label, times['mean_ms'], times['p95_ms'], old_stage and old_stage['mean_ms']))
+        for label, mean, p95, old_mean in rows:
+            change = ' %+6.1f%%' % ((mean / old_mean - 1) * 100) if old_mean else ''
+            print('  %-20s mean %8.3f ms  p95 %8.3f ms%s' % (label, mean, p95, change))
+        print('  %-20s %8d at most, %d dropped' % ('projectiles', result['projectiles_peak'], result['projectiles_dropped']))
+        if 'frame_peak_kb' in result:
+            print('  %-20s %8.1f KB over the frame start at its peak, peak %.0f KB' % ('memory', result['frame_peak_kb'], result['peak_kb']))
+
+
+# scenarios whose mean frame time got worse than the baseline by more than tolerance
+def regressions(results, baseline, tolerance):
+    slower = []
+    for name, result in results['scenarios'].items():
+        old = baseline['scenarios'].get(name)
+        if old and result['frame_mean_ms'] > old['frame_mean_ms'] * (1 + tolerance):
+            slower.append(name)
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description='benchmark the frame loop and its subsystems')
+    parser.add_argument('scenarios', nargs='*', help='any of %s, default: all of them' % ', '.join(SCENARIOS))
+    parser.add_argument('--frames', type=int, help='frames per scenario instead of its default')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc pass')
+    parser.add_argument('--save', metavar='PATH', help='write the results as JSON')
+    parser.add_argument('--compare', metavar='PATH', help='results to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='slowdown that counts as a regression')
+    args = parser.parse_args()
+    for name in args.scenarios:
+        if name not in SCENARIOS:
+            parser.error('unknown scenario: ' + name)
+
+    results = run(args.scenarios or list(SCENARIOS), args.frames, args.seed, memory=not args.no_memory)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+    if baseline:
+        slower = regressions(results, baseline, args.tolerance)
+        if slower:
+            print('slower than the baseline: ' + ', '.join(slower))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
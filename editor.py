@@ -1,8 +1,11 @@
+import os
 import sys
 import pygame
 
 from scripts.utils import load_images
 from scripts.tilemap import Tilemap
+from scripts.presenter import Presenter
+from scripts import levels, mapformat
 
 # how much we're multiplying the size of each pixel
 RENDER_SCALE = 2.0
@@ -10,14 +13,24 @@ RENDER_SCALE = 2.0
 
 class Editor:
     def __init__(self):
+        # python editor.py assets/maps/1.json edits a level, its bundle is recompiled on save.
+        # Only JSON maps: binary maps and bundles are built from them
+        self.map_path = sys.argv[1] if len(sys.argv) > 1 else 'map.json'
+        if not self.map_path.endswith('.json'):
+            sys.exit('the editor edits JSON maps, %s is not one' % self.map_path)
+
         pygame.init()
 
         pygame.display.set_caption('editor')
-        self.screen = pygame.display.set_mode((640, 480))
 
         # we render on this smaller displayer, and scale up to the bigger screen
         self.display = pygame.Surface((320, 240))  # default black
 
+        # NINJA_SCALE=stretch/integer/scaled as in the game
+        self.presenter = Presenter(self.display.get_size(), (int(320 * RENDER_SCALE), int(240 * RENDER_SCALE)),
+                                   mode=os.environ.get('NINJA_SCALE', 'stretch'))
+        self.screen = self.presenter.screen
+
         # May want to restrict frame for games since every frame is rendered
         # individually and we don't want out CPU to be overloaded
         self.clock = pygame.time.Clock()
@@ -32,9 +45,9 @@ class Editor:
         self.movement = [False, False, False, False]
 
         self.tilemap = Tilemap(self, tile_size=16)
-        
+
         try:
-            self.tilemap.load('map.json')
+            self.tilemap.load(self.map_path)
         except FileNotFoundError:
             pass
 
@@ -51,6 +64,9 @@ class Editor:
 
         self.ongrid = True
 
+        # grass and stone pick their variant from their neighbors while painting (toggle: Y)
+        self.autotiling = True
+
     def run(self):
         while True:
             # Fill the screen: everything from last fram will be replace with this color
@@ -70,10 +86,8 @@ class Editor:
             )
             current_tile_img.set_alpha(100)  # 0 is fully transparent
 
-            # mouse position
-            mpos = pygame.mouse.get_pos()
-            # because our game is scaled up by 2
-            mpos = (mpos[0] / RENDER_SCALE, mpos[1] / RENDER_SCALE)
+            # mouse position, on the display: the window is scaled up
+            mpos = self.presenter.to_source(pygame.mouse.get_pos())
 
             tile_pos = (int((mpos[0] + self.scroll[0]) // self.tilemap.tile_size),
                         int((mpos[1] + self.scroll[1]) // self.tilemap.tile_size))
@@ -88,23 +102,21 @@ class Editor:
 
             # left click to create tile
             if self.clicking and self.ongrid:
-                self.tilemap.tilemap[str(tile_pos[0]) + ';'+str(tile_pos[1])] = {
-                    'type': self.tile_list[self.tile_group],
-                    'variant': self.tile_variant,
-                    'pos': tile_pos
-                }
+                tile_type = self.tile_list[self.tile_group]
+                # the button stays down over many frames, only redo a cell that changes
+                current = self.tilemap.tile_at(tile_pos)
+                if current is None or current['type'] != tile_type or (not self.autotiling and current['variant'] != self.tile_variant):
+                    self.tilemap.set_tile(tile_pos, tile_type, self.tile_variant)
+                    if self.autotiling:
+                        self.tilemap.autotile_around(tile_pos)
 
             # right click to delete tiles
             if self.right_clicking:
-                tile_loc = str(tile_pos[0]) + ';' + str(tile_pos[1])
-                if tile_loc in self.tilemap.tilemap:
-                    del self.tilemap.tilemap[tile_loc]
-                for tile in self.tilemap.offgrid_tiles.copy():
-                    tile_img = self.assets[tile['type']][tile['variant']]
-                    # hitbox
-                    tile_r = pygame.Rect(tile['pos'][0] - self.scroll[0], tile['pos'][1] - self.scroll[1], tile_img.get_width(), tile_img.get_height())
-                    if tile_r.collidepoint(mpos):
-                        self.tilemap.offgrid_tiles.remove(tile)
+                if self.tilemap.remove_tile(tile_pos) and self.autotiling:
+                    self.tilemap.autotile_around(tile_pos)
+                # hitbox test against the offgrid index, in world space
+                for tile in self.tilemap.offgrid_at((mpos[0] + self.scroll[0], mpos[1] + self.scroll[1])):
+                    self.tilemap.remove_offgrid(tile)
             self.display.blit(current_tile_img, (5, 5))
 
             # blit essentially copy the memory to the position
@@ -117,7 +129,7 @@ class Editor:
                     if event.button == 1:  # left click
                         self.clicking = True
                         if not self.ongrid:
-                            self.tilemap.offgrid_tiles.append(
+                            self.tilemap.add_offgrid(
                                 {'type': self.tile_list[self.tile_group], 'variant': self.tile_variant, 'pos': (mpos[0] + render_scroll[0], mpos[1] + self.scroll[1])})
                     if event.button == 3:  # right click
                         self.right_clicking = True
@@ -156,8 +168,15 @@ class Editor:
                         self.ongrid = not self.ongrid
                     if event.key == pygame.K_t:
                         self.tilemap.autotile()
+                    if event.key == pygame.K_y:
+                        self.autotiling = not self.autotiling
                     if event.key == pygame.K_o:
-                        self.tilemap.save('map.json')
+                        self.tilemap.save(self.map_path)
+                        try:
+                            levels.build()
+                        except (OSError, ValueError, mapformat.MapFormatError) as e:
+                            # the map is saved, the game compiles it again when it starts
+                            print('could not compile the levels: %s' % e, file=sys.stderr)
                     if event.key == pygame.K_LSHIFT:
                         self.shift = True
                 if event.type == pygame.KEYUP:
@@ -171,8 +190,7 @@ class Editor:
                         self.movement[3] = False
                     if event.key == pygame.K_LSHIFT:
                         self.shift = False
-            self.screen.blit(pygame.transform.scale(
-                self.display, self.screen.get_size()), (0, 0))
+            self.presenter.present(self.display)
             pygame.display.update()
             self.clock.tick(60)  # 60 fps
 
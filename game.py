@@ -1,97 +1,129 @@
 import os
 import sys
 import random
-import math
+import time
+import argparse
+import hashlib
 import pygame
 
 from scripts.player import Player
 from scripts.enemy import Enemy
-from scripts.utils import load_image, load_images, Animation
+from scripts.assets import AssetRegistry, manifest, SOUNDS, CHARACTERS, CHARACTER_ACTIONS, DEFAULT_CHARACTER
 from scripts.tilemap import Tilemap
-from scripts.cloud import Clouds
-from scripts.particle import Particle
-from scripts.spark import Spark
-
-variant_player = 0
-variant_enemy = 1
+from scripts.levels import load_levels, extract_level
+from scripts.sky import Sky
+from scripts.particle import ParticleSystem
+from scripts.spark import SparkPool
+from scripts.pipeline import FramePipeline
+from scripts.outline import OutlinePass
+from scripts.ui import UIResources
+from scripts.presenter import Presenter
+from scripts.timestep import FixedTimestep
+from scripts.replay import InputRecorder, InputReplay
+from scripts.profiler import Profiler, ProfilerOverlay
+from scripts.activity import ActivityScheduler
+from scripts.spatial import EntityHash
+from scripts.projectile import ProjectileManager, SHURIKEN
+
+PAUSED_FPS = 20
+# the game logic always steps at 60 per second, frames are drawn up to NINJA_FPS per second
+SIMULATION_RATE = 60
+MAX_FPS = int(os.environ.get('NINJA_FPS', '60'))
+# how far (px) an enemy can move in one update: falling at most 5, plus up to a
+# tile when a collision pushes it out of a tile it was stuck in
+DASH_MARGIN = 24
 
 class Game:
-    def __init__(self):
-        character_str = 'ninja'
+    # headless: no window or sound devices (SDL dummy drivers), one simulation step per frame, as fast as possible
+    # render: draw frames at all, headless runs usually skip it
+    # seed: for every random number the game logic uses, same seed + same input = same run
+    # record/replay: path of an input script to write/play back, see scripts/replay.py
+    # trace: path of a profiler trace (.json for chrome://tracing or .csv) written when the game ends
+    def __init__(self, headless=False, render=True, seed=None, record=None, replay=None, trace=None, profiler=None):
+        self.headless = headless
+        if headless:
+            os.environ['SDL_VIDEODRIVER'] = 'dummy'
+            os.environ['SDL_AUDIODRIVER'] = 'dummy'
         pygame.init()
 
+        self.replay = InputReplay(replay) if replay else None
+        if self.replay:
+            seed = self.replay.seed
+        if seed is None:
+            seed = random.randrange(2 ** 32)
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.recorder = InputRecorder(record, seed) if record else None
+        self.steps = 0  # simulation steps so far, input scripts are keyed by it
+
+        # F3 or NINJA_PROFILE=1 shows the profiler overlay
+        self.profiler = profiler or Profiler(trace_path=trace)
+        if os.environ.get('NINJA_PROFILE') == '1':
+            self.profiler.toggle_overlay()
+        self.profiler_overlay = ProfilerOverlay()
+
         pygame.display.set_caption('Ninja')
         # resolution of the window
         self.window_width = 1200
         self.window_height = 900
-        self.screen = pygame.display.set_mode((self.window_width, self.window_height))
 
         # we render on these smaller displays, and scale up to the the bigger window to avoid too small images
         # the resolution here should math the resolution of the background image, otherwise there will be black space
         self.display = pygame.Surface((320, 240), pygame.SRCALPHA)  # default black
         self.display_2 = pygame.Surface((320, 240))  # default black
 
+        # NINJA_SCALE=stretch/integer/scaled, how display_2 gets onto the window
+        self.presenter = Presenter(self.display_2.get_size(), (self.window_width, self.window_height),
+                                   mode=os.environ.get('NINJA_SCALE', 'stretch'))
+        self.screen = self.presenter.screen
+
+        self.ui = UIResources(self.display.get_size(), self.screen.get_size())
+
+        # NINJA_OUTLINE=layers/surfarray/off, O cycles through them in game
+        self.outline = OutlinePass(self.display.get_size(), mode=os.environ.get('NINJA_OUTLINE', 'layers'))
+
         # May want to restrict frame for games since every frame is rendered
         # individually and we don't want out CPU to be overloaded
         # 1 frame = 1 iteration of the game loop while true
         self.clock = pygame.time.Clock()
+        self.timestep = FixedTimestep(rate=SIMULATION_RATE)
+        self.last_frame_time = time.perf_counter()
 
         self.movement = [False, False]
 
         self.paused = False
+        self.pause_shown = False  # the paused frame is on screen, nothing to redraw until unpaused
         
-        character_size = (0, 0)
-        if character_str == 'ninja':
-            character_size = (8, 15)
-        elif character_str == 'pekka':
-            character_size = (60, 47)
-        elif character_str == 'knight':
-            character_size = (21, 22)
-
-
-        self.assets = {
-            'decor': load_images('tiles/decor'),
-            'grass': load_images('tiles/grass'),
-            'stone': load_images('tiles/stone'),
-            'pickups': load_images('tiles/pickups'),
-            'large_decor': load_images('tiles/large_decor'),
-            character_str : load_image('entities/'+ character_str + '.png'),
-            'background': load_image('background_night.png'),
-            'clouds': load_images('clouds'),
-            'enemy/idle': Animation(load_images('entities/enemy/idle'), img_dur=6),
-            'enemy/run': Animation(load_images('entities/enemy/run'), img_dur=4),
-            character_str + '/idle': Animation(load_images('entities/' + character_str + '/idle'), img_dur=6),
-            character_str + '/run': Animation(load_images('entities/' + character_str + '/run'), img_dur=4),
-            character_str + '/jump': Animation(load_images('entities/'+ character_str + '/jump')),
-            character_str + '/slide': Animation(load_images('entities/' + character_str + '/slide')),
-            character_str + '/dash': Animation(load_images('entities/' + character_str + '/dash')),
-            character_str + '/wall_slide': Animation(load_images('entities/' + character_str + '/wall_slide')),
-            'particle/leaf': Animation(load_images('particles/leaf'), img_dur=20, loop=False),
-            'particle/particle': Animation(load_images('particles/particle'), img_dur=6, loop=False),
-            'shuriken': load_image('shuriken.png'),
-            'gun': load_image('gun.png'),
-            'projectile': load_image('projectile.png')
-        }
-
-        self.sfx = {
-            'jump': pygame.mixer.Sound('assets/sfx/jump.wav'),
-            'dash': pygame.mixer.Sound('assets/sfx/dash.wav'),
-            'hit': pygame.mixer.Sound('assets/sfx/hit.wav'),
-            'shoot': pygame.mixer.Sound('assets/sfx/shoot.wav'),
-            'ambience': pygame.mixer.Sound('assets/sfx/ambience.wav'),
-        }
-        self.sfx['ambience'].set_volume(0.2)
-        self.sfx['shoot'].set_volume(0.4)
-        self.sfx['hit'].set_volume(0.8)
-        self.sfx['dash'].set_volume(0.3)
-        self.sfx['jump'].set_volume(0.7)
-
-        self.clouds = Clouds(self.assets['clouds'], count=16)
-
-        self.player = Player(self, (50, 50), character_size)
+        # only described here, every asset is loaded the first time it is used
+        self.character = os.environ.get('NINJA_CHARACTER', DEFAULT_CHARACTER)
+        self.assets = AssetRegistry(manifest(self.character))
+        self.sfx = AssetRegistry(SOUNDS)
+        self.sfx.prefetch(SOUNDS)
+
+        # the background plus parallax cloud bands; NINJA_CLOUDS and NINJA_CLOUD_BANDS for a denser sky.
+        # Its own generator, seeded apart from the game's: how the sky looks must not change
+        # what the game logic draws, nor copy the start of its random numbers
+        self.sky = Sky(self.assets['background'], self.assets['clouds'], self.display_2.get_size(),
+                       count=int(os.environ.get('NINJA_CLOUDS', 16)), bands=int(os.environ.get('NINJA_CLOUD_BANDS', 4)),
+                       rng=random.Random('%d-sky' % seed))
+
+        self.player = Player(self, (50, 50), CHARACTERS[self.character]['size'])
 
         self.tilemap = Tilemap(self, tile_size=16)
 
+        self.particles = ParticleSystem(self)
+        self.sparks = SparkPool()
+        self.projectiles = ProjectileManager(self)
+        # far away enemies sleep, NINJA_ACTIVITY=0 simulates every enemy every step
+        self.activity = ActivityScheduler(enabled=os.environ.get('NINJA_ACTIVITY') != '0')
+        # where the player and the enemies are, for hit tests and anything else looking for entities nearby
+        self.entities = EntityHash(cell_size=32)
+        self.indexed_enemies = None  # the enemy list the hash was built from
+        self.dash_targets = set()  # enemies the dashing player can reach this step
+
+        # compiled level bundles, rebuilt for the maps that changed
+        self.levels = load_levels()
+
         # Game starts from level 0
         self.level = 0
         self.load_level(self.level)
@@ -100,229 +132,371 @@ class Game:
 
         self.current_level_passed = False
 
+        # one frame: input -> simulate -> render world -> post process -> scale -> present
+        # NINJA_DEBUG=1 asserts the window is presented once per frame
+        self.pipeline = FramePipeline(debug=os.environ.get('NINJA_DEBUG') == '1', profiler=self.profiler)
+        self.pipeline.add_stage('input', self.handle_events)
+        self.pipeline.add_stage('simulate', self.simulate)
+        if render:
+            self.pipeline.add_stage('render_world', self.render_world)
+            self.pipeline.add_stage('post_process', self.post_process)
+            self.pipeline.add_stage('scale', self.scale)
+            self.pipeline.add_stage('present', self.present)
+
     def load_level(self, map_id):
-        self.tilemap.load('assets/maps/' + str(map_id) + '.json')
+        self.tilemap.load(self.levels.path(map_id))
         # self.tilemap.load('assets/maps/map.json')
-        self.leaf_spawners = []
+        # a compiled level lists its spawners, any other map is searched for them
+        info = self.tilemap.level_info or extract_level(self.tilemap)
 
-        self.enemies = []
+        self.leaf_spawners = [pygame.Rect(rect) for rect in info['leaf_spawners']]
 
-        for tree in self.tilemap.extract([('large_decor', 2)], keep=True):
-            self.leaf_spawners.append(pygame.Rect(
-                4 + tree['pos'][0], 4 + tree['pos'][1], 23, 13))
+        self.enemies = [Enemy(self, pos, (8, 15)) for pos in info['enemies']]
 
-        for character in self.tilemap.extract([('character', variant_player), ('character', variant_enemy)]):
-        # for spawner in self.tilemap.extract([('character', 0)]):
-            if character['variant'] == variant_player:
-                self.player.pos = character['pos']
-                self.player.air_time = 0
-            else:
-                self.enemies.append(Enemy(self, character['pos'], (8, 15)))
+        if info['player'] is not None:
+            self.player.pos = list(info['player'])
+            self.player.prev_pos = list(info['player'])  # no interpolation from the old spot
+            self.player.air_time = 0
 
-        self.shuriken = []
-        self.projectiles = []
-        self.particles = []
-        self.sparks = []
+        self.projectiles.clear()
+        self.particles.clear()
+        self.sparks.clear()
 
         # can be seen as camera's location, used to focus the main view on the player
         self.camera_offset = [0, 0] 
+        self.prev_camera_offset = [0, 0]
         self.dead = 0
+        self.activity.reset()
+        self.activity.update(self.enemies, self.camera_offset, self.display.get_size())
         
         # for the black circle transition effect between levels
         self.transition = -30
 
-    def run(self):
-        pygame.mixer.music.load('assets/music.wav')
-        pygame.mixer.music.set_volume(0.5)
-        pygame.mixer.music.play(-1)  # negative: loop forever
-        self.sfx['ambience'].play(-1)
-
-        while True:
-            if not self.paused:
-                self.display.fill((0, 0, 0, 0))
-                # Fill the screen: everything from last fram will be replace with this color
-                # Create a rectangle with: top left pos, width and height
-                # self.display.fill((14, 219, 248))
-                self.display_2.blit(self.assets['background'], (0, 0))
-
-                self.screenshake = max(0, self.screenshake - 1)
-
-                if self.current_level_passed:
-                    self.transition += 1
-                    if self.transition > 30:
-                        # ensure don't go above max level
-                        self.level = min(
-                            self.level + 1, len(os.listdir('assets/maps')) - 1)
-                        # load level when complete black
-                        self.load_level(self.level)
-                        self.current_level_passed = False
-                if self.transition < 0:
-                    self.transition += 1
-
-                if self.dead:
-                    self.dead += 1
-                    if self.dead >= 10:
-                        self.transition = min(30, self.transition + 1)
-                    if self.dead > 40:  # timer
-                        self.load_level(self.level)
-
-                self.camera_offset[0] += (self.player.rect().centerx - self.display.get_width() / 2 - self.camera_offset[0]) / 30
-
-                self.camera_offset[1] += (self.player.rect().centery - self.display.get_height() / 2 - self.camera_offset[1]) / 30
-
-                render_camera_offset = (int(self.camera_offset[0]), int(self.camera_offset[1]))
-                # render_camera_offset = (0, 0)
-
-                for rect in self.leaf_spawners:
-                    # spawn rate: bigger tree spawn more
-                    # multiply by big number make it not spawning every frame
-                    if random.random() * 49999 < rect.width * rect.height:
-                        pos = (rect.x + random.random() * rect.width,
-                               rect.y + random.random() * rect.height)
-                        self.particles.append(
-                            Particle(self, 'leaf', pos, velocity=[-0.1, 0.3], frame=random.randint(0, 20)))
-
-                self.clouds.update()
-                # cloud no outline: display_2
-                self.clouds.render(self.display_2, offset=render_camera_offset)
-                # avoid subpixel movement for the camera
-                self.tilemap.render(self.display, offset=render_camera_offset)
-                
-                for shuriken in self.shuriken.copy():
-                    shuriken[0][0] += shuriken[1]
-                    shuriken[2] += 1  # timer
-                    img = self.assets['shuriken']
-                    x = shuriken[0][0] - img.get_width() / 2 - render_camera_offset[0]
-                    y = shuriken[0][1] - img.get_height() / 2 - render_camera_offset[1]
-                    self.display.blit(img, (x, y))
-
-                for enemy in self.enemies.copy():
-                    kill = enemy.update(self.tilemap, (0, 0))
-                    enemy.render(self.display, offset=render_camera_offset)
-                    if kill:
-                        self.enemies.remove(enemy)
-                        if not len(self.enemies):
-                            self.current_level_passed = True
-
-                if not self.dead:
-                    # movement[1] == 0 since we move horizontally
-                    self.player.update(
-                        self.tilemap, (self.movement[1] - self.movement[0], 0))
-                    self.player.render(self.display, camera_offset=render_camera_offset)
-                    
-                for projectile in self.projectiles.copy():
-                    projectile[0][0] += projectile[1]
-                    projectile[2] += 1  # timer
-                    img = self.assets['projectile']
-                    self.display.blit(img, (projectile[0][0] - img.get_width(
-                    ) / 2 - render_camera_offset[0], projectile[0][1] - img.get_height() / 2 - render_camera_offset[1]))
-                    pygame.display.update()
-                    if self.tilemap.solid_check(projectile[0]):
-                        self.projectiles.remove(projectile)
-                        for i in range(4):
-                            self.sparks.append(Spark(
-                                projectile[0], random.random() - 0.5 + (math.pi if projectile[1] > 0 else 0), 2 + random.random()))
-
-                    elif projectile[2] > 360:  # 6 seconds
-                        self.projectiles.remove(projectile)
-                    elif abs(self.player.dashing) < 50:  # invincible during dash
-                        if self.player.rect().collidepoint(projectile[0]):
-                            self.projectiles.remove(projectile)
-                            self.dead += 1
-                            self.sfx['hit'].play()
-                            self.screenshake = max(16, self.screenshake)
-                            # when hit player: death
-                            for i in range(30):
-                                angle = random.random() * math.pi * 2
-                                speed = random.random() * 5
-                                self.sparks.append(
-                                    Spark(self.player.rect().center, angle, 2 + random.random()))
-                                # angle of particle is opposite
-                                self.particles.append(Particle(self, 'particle', self.player.rect().center, velocity=[
-                                                      math.cos(angle + math.pi) * speed * 0.5, math.sin(angle + math.pi) * speed * 0.5], frame=random.randint(0, 7)))
-
-                for spark in self.sparks.copy():
-                    kill = spark.update()
-                    spark.render(self.display, offset=render_camera_offset)
-                    if kill:
-                        self.sparks.remove(spark)
-
-                display_mask = pygame.mask.from_surface(self.display)
-                display_sillhouette = display_mask.to_surface(
-                    setcolor=(0, 0, 0, 180), unsetcolor=(0, 0, 0, 0))
-
-                # draw outline
-                for offset in [(-1, 0), (1, 0), (0, 1), (0, 1)]:
-                    self.display_2.blit(display_sillhouette, offset)
-
-                for particle in self.particles.copy():
-                    kill = particle.update()
-                    particle.render(self.display, offset=render_camera_offset)
-                    if particle.type == 'leaf':
-                        # move particle back and forth naturally
-                        particle.pos[0] += math.sin(
-                            particle.animation.frame * 0.035) * 0.3
-                    if kill:
-                        self.particles.remove(particle)
-
-            # blit essentially copy the memory to the position
-            # we can blit any surface to to others
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:  # click X on the window
-                    pygame.quit()
-                    sys.exit()
-                if event.type == pygame.KEYDOWN:
-                    if event.key == pygame.K_LEFT or event.key == pygame.K_a:
-                        self.movement[0] = True
-                    if event.key == pygame.K_RIGHT or event.key == pygame.K_d:
-                        self.movement[1] = True
-                    if event.key == pygame.K_UP or event.key == pygame.K_k:  # magic: negative velocity == jump
-                        if self.player.jump():
-                            self.sfx['jump'].play()
-                    if event.key == pygame.K_j:
-                        self.player.attack()
-                    if event.key == pygame.K_l:
-                        self.player.dash()
-                    if event.key == pygame.K_ESCAPE:
-                        self.paused = not self.paused
-                if event.type == pygame.KEYUP:
-                    if event.key == pygame.K_LEFT or event.key == pygame.K_a:
-                        self.movement[0] = False
-                    if event.key == pygame.K_RIGHT or event.key == pygame.K_d:
-                        self.movement[1] = False
-            if self.transition:
-                transition_surf = pygame.Surface(self.display.get_size())
-                pygame.draw.circle(transition_surf, (255, 255, 255), (self.display.get_width() // 2, self.display.get_height() // 2), (30 - abs(self.transition)) * 8)
-                transition_surf.set_colorkey((255, 255, 255))
-                self.display.blit(transition_surf, (0, 0))
-
-            self.display_2.blit(self.display, (0, 0))
-
-            screenshake_offset = (random.random() * self.screenshake - self.screenshake/2,
-                                  random.random() * self.screenshake - self.screenshake/2)
-            self.screen.blit(pygame.transform.scale(
-                self.display_2, self.screen.get_size()), screenshake_offset)
-            # self.screen.blit(pygame.transform.scale(
-            #     self.display, self.screen.get_size()), screenshake_offset)
-            
-            if self.paused:
-                # Draw a semi-transparent overlay
-                overlay = pygame.Surface(
-                    (self.window_width, self.window_height))
-                overlay.fill((100, 100, 100))
-                # Set alpha value for transparency (0-255)
-                overlay.set_alpha(128)
-                # Blit overlay on top of the game
-                self.screen.blit(overlay, (0, 0))
-
-                font = pygame.font.Font(None, 120)
-                paused_text = font.render('Paused', True, (255, 255, 255))
-                text_rect = paused_text.get_rect(center=(self.screen.get_width() / 2,
-                                                         self.screen.get_height() / 2 - paused_text.get_height() / 2))
-                self.screen.blit(paused_text, text_rect)
-            # update everything on the screen
-            pygame.display.update()
-            self.clock.tick(60)  # 60 fps of the while true loop using sleep mechanism
-
-
-Game().run()
+        # while this level is played, load what the player and the next level will need
+        prefetch = [self.character + '/' + action for action in CHARACTER_ACTIONS]
+        if map_id + 1 < len(self.levels):
+            prefetch += sorted(self.levels.assets(map_id + 1))
+        self.assets.prefetch(prefetch)
+
+    # max_frames: stop after that many frames instead of running until the window is closed
+    def run(self, max_frames=None):
+        if not self.headless:
+            pygame.mixer.music.load('assets/music.wav')
+            pygame.mixer.music.set_volume(0.5)
+            pygame.mixer.music.play(-1)  # negative: loop forever
+            self.sfx['ambience'].play(-1)
+
+        self.last_frame_time = time.perf_counter()
+        frames = 0
+        while max_frames is None or frames < max_frames:
+            if self.replay and self.replay.done(self.steps):
+                break
+            self.pipeline.run_frame()
+            frames += 1
+            if not self.headless:
+                # cap the frame rate of the while true loop using sleep mechanism
+                # while paused only input is polled, so a lower rate is enough
+                self.clock.tick(PAUSED_FPS if self.pause_shown else MAX_FPS)
+        if self.recorder:
+            self.recorder.save(self.steps)
+        self.profiler.dump()
+        return frames
+
+    def quit(self):
+        if self.recorder:
+            self.recorder.save(self.steps)
+        self.profiler.dump()
+        pygame.quit()
+        sys.exit()
+
+    def handle_events(self):
+        # while a script is replayed the keyboard only pauses, the script plays
+        play = not self.replay
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:  # click X on the window
+                self.quit()
+            if event.type == pygame.VIDEOEXPOSE:  # window needs a redraw, e.g. while paused
+                self.pause_shown = False
+            if event.type == pygame.KEYDOWN:
+                if play and (event.key == pygame.K_LEFT or event.key == pygame.K_a):
+                    self.apply_input('left', True)
+                if play and (event.key == pygame.K_RIGHT or event.key == pygame.K_d):
+                    self.apply_input('right', True)
+                if play and (event.key == pygame.K_UP or event.key == pygame.K_k):  # magic: negative velocity == jump
+                    self.apply_input('jump')
+                if play and event.key == pygame.K_j:
+                    self.apply_input('attack')
+                if play and event.key == pygame.K_l:
+                    self.apply_input('dash')
+                if event.key == pygame.K_ESCAPE:
+                    self.paused = not self.paused
+                    self.pause_shown = False
+                if event.key == pygame.K_o:
+                    self.outline.toggle()
+                if event.key == pygame.K_F3:
+                    self.profiler.toggle_overlay()
+            if event.type == pygame.KEYUP:
+                if play and (event.key == pygame.K_LEFT or event.key == pygame.K_a):
+                    self.apply_input('left', False)
+                if play and (event.key == pygame.K_RIGHT or event.key == pygame.K_d):
+                    self.apply_input('right', False)
+
+    # everything the player does goes through here, so it can be recorded and replayed
+    def apply_input(self, action, value=None):
+        if self.recorder:
+            self.recorder.record(self.steps, action, value)
+        if action == 'left':
+            self.movement[0] = value
+        elif action == 'right':
+            self.movement[1] = value
+        elif action == 'jump':
+            if self.player.jump():
+                self.sfx['jump'].play()
+        elif action == 'attack':
+            self.player.attack()
+        elif action == 'dash':
+            self.player.dash()
+
+    # game logic only, nothing is drawn here: as many fixed steps as the time since the last frame asks for
+    def simulate(self):
+        now = time.perf_counter()
+        frame_time = now - self.last_frame_time
+        self.last_frame_time = now
+        if self.headless:
+            frame_time = self.timestep.step  # exactly one step per frame, however long it took
+        if self.paused:
+            self.timestep.reset()
+            return
+
+        for i in range(self.timestep.advance(frame_time)):
+            self.step()
+
+    # one tick of the game logic, every speed and timer in the game counts these
+    def step(self):
+        if self.replay:
+            for step, action, value in self.replay.events_at(self.steps):
+                self.apply_input(action, value)
+        self.steps += 1
+        self.prev_camera_offset[0], self.prev_camera_offset[1] = self.camera_offset
+        self.screenshake = max(0, self.screenshake - 1)
+
+        if self.current_level_passed:
+            self.transition += 1
+            if self.transition > 30:
+                # ensure don't go above max level
+                self.level = min(self.level + 1, len(self.levels) - 1)
+                # load level when complete black
+                self.load_level(self.level)
+                self.current_level_passed = False
+        if self.transition < 0:
+            self.transition += 1
+
+        if self.dead:
+            self.dead += 1
+            if self.dead >= 10:
+                self.transition = min(30, self.transition + 1)
+            if self.dead > 40:  # timer
+                self.load_level(self.level)
+
+        self.camera_offset[0] += (self.player.rect().centerx - self.display.get_width() / 2 - self.camera_offset[0]) / 30
+
+        self.camera_offset[1] += (self.player.rect().centery - self.display.get_height() / 2 - self.camera_offset[1]) / 30
+        self.tilemap.stream_around(self.camera_offset, self.display.get_size())
+
+        for rect in self.leaf_spawners:
+            # spawn rate: bigger tree spawn more
+            # multiply by big number make it not spawning every frame
+            if self.rng.random() * 49999 < rect.width * rect.height:
+                pos = (rect.x + self.rng.random() * rect.width,
+                       rect.y + self.rng.random() * rect.height)
+                self.particles.spawn('leaf', pos, velocity=[-0.1, 0.3], frame=self.rng.randint(0, 20))
+
+        self.sky.update()
+
+        profiler = self.profiler
+        # only the enemies around the camera, the rest sleep until it comes near
+        with profiler.section('enemies'):
+            self.index_entities()
+            self.dash_targets = self.find_dash_targets()
+            for enemy in self.activity.update(self.enemies, self.camera_offset, self.display.get_size()).copy():
+                kill = enemy.update(self.tilemap, (0, 0))
+                if kill:
+                    self.remove_enemy(enemy)
+                else:
+                    self.entities.move(enemy, enemy.rect())
+
+        with profiler.section('player'):
+            if not self.dead:
+                # movement[1] == 0 since we move horizontally
+                self.player.update(
+                    self.tilemap, (self.movement[1] - self.movement[0], 0))
+                self.entities.move(self.player, self.player.rect())
+
+        # moves, expires and resolves hits for bullets and shuriken in one pass
+        with profiler.section('projectiles'):
+            for enemy in self.projectiles.update(self.tilemap, self.entities, self.player):
+                self.remove_enemy(enemy)
+
+        with profiler.section('effects'):
+            self.sparks.update()
+            # all particles are stepped and culled in bulk
+            self.particles.update()
+
+    # the entity hash holds the player and every enemy, awake or asleep (a shuriken flies
+    # far enough to hit sleeping ones). Rebuilt when the enemy list was replaced or grew
+    def index_entities(self):
+        if self.indexed_enemies is self.enemies and len(self.entities) == len(self.enemies) + 1:
+            return
+        self.indexed_enemies = self.enemies
+        self.entities.clear()
+        for enemy in self.enemies:
+            self.entities.insert(enemy, enemy.rect())
+        self.entities.insert(self.player, self.player.rect())
+
+    # enemies near enough to the dashing player to be killed by it this step, from the
+    # entity hash. They move a few pixels in their update, each does the exact test after
+    def find_dash_targets(self):
+        if abs(self.player.dashing) < 50:
+            return set()
+        near = self.entities.query_rect(self.player.rect().inflate(DASH_MARGIN * 2, DASH_MARGIN * 2))
+        return set(entity for entity in near if entity is not self.player)
+
+    def remove_enemy(self, enemy):
+        self.enemies.remove(enemy)
+        self.activity.remove(enemy)
+        self.entities.remove(enemy)
+        if not len(self.enemies):
+            self.current_level_passed = True
+
+    # fingerprint of the game logic state, two runs with the same seed and input must agree on it
+    def state_hash(self):
+        projectiles = self.projectiles
+        state = (self.level, self.steps, self.dead, self.transition, self.screenshake,
+                 self.player.pos, self.player.velocity, self.player.dashing, self.player.air_time,
+                 [(enemy.pos, enemy.velocity, enemy.walking) for enemy in self.enemies],
+                 projectiles.x[:projectiles.count], projectiles.y[:projectiles.count],
+                 projectiles.kind[:projectiles.count], len(self.sparks), len(self.particles),
+                 self.rng.getstate())
+        return hashlib.sha1(repr(state).encode()).hexdigest()
+
+    # draws the level on display (outlined layer) and the sky on display_2
+    def render_world(self):
+        if self.paused:
+            return  # keep the last frame
+
+        self.display.fill((0, 0, 0, 0))
+        # Fill the screen: everything from last fram will be replace with this color
+        # Create a rectangle with: top left pos, width and height
+        # self.display.fill((14, 219, 248))
+
+        # the camera and the entities are drawn between the last two steps, alpha of the way
+        alpha = self.timestep.alpha
+        camera_x = self.prev_camera_offset[0] + (self.camera_offset[0] - self.prev_camera_offset[0]) * alpha
+        camera_y = self.prev_camera_offset[1] + (self.camera_offset[1] - self.prev_camera_offset[1]) * alpha
+        # avoid subpixel movement for the camera
+        render_camera_offset = (int(camera_x), int(camera_y))
+        self.render_camera_offset = render_camera_offset
+        # render_camera_offset = (0, 0)
+
+        profiler = self.profiler
+        # background and clouds, no outline: display_2
+        with profiler.section('sky'):
+            self.sky.render(self.display_2, offset=render_camera_offset)
+        with profiler.section('tiles'):
+            self.tilemap.render(self.display, offset=render_camera_offset)
+
+        # areas the dynamic objects were drawn to, the outline pass only reads these back
+        self.dirty_rects = []
+        with profiler.section('enemies'):
+            # sleeping enemies are all out of view
+            for enemy in self.activity.awake:
+                self.dirty_rects.append(enemy.render(self.display, offset=self.entity_offset(enemy, render_camera_offset)))
+
+        with profiler.section('player'):
+            if not self.dead:
+                self.dirty_rects.append(self.player.render(self.display, camera_offset=self.entity_offset(self.player, render_camera_offset)))
+
+        with profiler.section('projectiles'):
+            self.dirty_rects.extend(self.projectiles.render(self.display, offset=render_camera_offset))
+        with profiler.section('sparks'):
+            self.dirty_rects.extend(self.sparks.render(self.display, offset=render_camera_offset))
+
+    # camera offset that draws an entity at its interpolated position instead of its current one
+    def entity_offset(self, entity, offset):
+        behind = 1 - self.timestep.alpha
+        return (offset[0] + (entity.pos[0] - entity.prev_pos[0]) * behind,
+                offset[1] + (entity.pos[1] - entity.prev_pos[1]) * behind)
+
+    # outline, effects without outline, level transition, then flatten the layers into display_2
+    def post_process(self):
+        if self.pause_shown:
+            return
+        if not self.paused:
+            render_camera_offset = self.render_camera_offset
+            with self.profiler.section('outline'):
+                self.outline.apply(self.display, self.display_2, self.tilemap, render_camera_offset, self.dirty_rects)
+
+            # particles are drawn after the outline pass so they don't get one
+            with self.profiler.section('particles'):
+                self.particles.render(self.display, offset=render_camera_offset)
+
+        if self.transition:
+            self.display.blit(self.ui.transition((30 - abs(self.transition)) * 8), (0, 0))
+
+        # blit essentially copy the memory to the position
+        # we can blit any surface to to others
+        self.display_2.blit(self.display, (0, 0))
+
+    # upscale to the window, plus everything drawn in window resolution
+    def scale(self):
+        if self.pause_shown:
+            return
+        screenshake_offset = (random.random() * self.screenshake - self.screenshake/2,
+                              random.random() * self.screenshake - self.screenshake/2)
+        with self.profiler.section('upscale'):
+            self.presenter.present(self.display_2, screenshake_offset)
+
+        if self.paused:
+            self.ui.render_pause(self.screen)
+
+        # numbers of the frames before this one, this one is not done yet
+        if self.profiler.overlay:
+            with self.profiler.section('overlay'):
+                counts = {'enemies': len(self.enemies), 'particles': len(self.particles), 'sparks': len(self.sparks),
+                          'shuriken': self.projectiles.count_kind(SHURIKEN)}
+                if self.projectiles.dropped:
+                    counts['dropped'] = self.projectiles.dropped  # spawns lost to a full projectile manager
+                self.profiler_overlay.render(self.screen, self.profiler, self.clock.get_fps(), counts)
+
+    def present(self):
+        # the only place the window is updated
+        if self.pause_shown:
+            self.pipeline.present([])  # unchanged paused frame
+        else:
+            self.pipeline.present()
+            self.pause_shown = self.paused
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Ninja')
+    parser.add_argument('--headless', action='store_true', help='no window and no sound, one step per frame as fast as possible')
+    parser.add_argument('--no-render', action='store_true', help='only run the game logic')
+    parser.add_argument('--seed', type=int, help='seed of the game logic random numbers')
+    parser.add_argument('--frames', type=int, help='stop after this many frames')
+    parser.add_argument('--record', metavar='PATH', help='record the input to an input script')
+    parser.add_argument('--replay', metavar='PATH', help='play an input script back')
+    parser.add_argument('--hash', action='store_true', help='print the state hash when done')
+    parser.add_argument('--trace', metavar='PATH', help='write a profiler trace, .json (chrome://tracing) or .csv')
+    args = parser.parse_args()
+
+    game = Game(headless=args.headless, render=not args.no_render, seed=args.seed,
+                record=args.record, replay=args.replay, trace=args.trace)
+    start = time.perf_counter()
+    frames = game.run(max_frames=args.frames)
+    if args.hash:
+        elapsed = time.perf_counter() - start
+        print('%s  %d frames, %d steps, %.0f frames/s' % (game.state_hash(), frames, game.steps, frames / max(elapsed, 1e-9)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+import pygame
+
+from scripts.spatial import SpatialHash
+from scripts.projectile import LIFETIME
+
+# enemies this far (px) past the edge of the view are simulated in full: the range
+# of an enemy bullet (1.5 px per step) less about half the view, so anything that
+# could still shoot the player is awake
+ACTIVITY_RADIUS = int(1.5 * LIFETIME) - 140
+# an awake enemy only goes back to sleep this much further out, so one walking
+# along the border doesn't flip every step
+SLEEP_MARGIN = 32
+
+
+class ActivityScheduler:
+    """
+    Splits the enemies of a level into awake ones, which are updated and
+    drawn every step, and sleeping ones, which are frozen where they are
+    until the camera comes near again. Sleepers don't move, so they wait
+    in a spatial hash and waking them is one query around the view: the
+    cost per step follows the enemies near the camera, not the level size.
+    Which enemies are awake only depends on the camera, so a run stays
+    reproducible, and awake enemies keep the order of the enemy list
+    """
+    def __init__(self, radius=ACTIVITY_RADIUS, margin=SLEEP_MARGIN, enabled=True):
+        self.radius = radius
+        self.margin = margin
+        self.enabled = enabled
+        self.reset()
+
+    def reset(self):
+        self.enemies = None  # the list the split was made from
+        self.order = {}  # id(enemy): index in that list
+        self.awake = []
+        self.sleeping = SpatialHash(cell_size=128)
+
+    # also rebuilds when the game replaced or grew the list since last time
+    def update(self, enemies, offset, view_size):
+        if enemies is not self.enemies or len(enemies) != len(self.awake) + len(self.sleeping):
+            self.rebuild(enemies)
+        if not self.enabled:
+            self.awake = list(enemies)
+            return self.awake
+
+        view = pygame.Rect(int(offset[0]), int(offset[1]), view_size[0], view_size[1])
+        wake_area = view.inflate(self.radius * 2, self.radius * 2)
+        sleep_area = wake_area.inflate(self.margin * 2, self.margin * 2)
+
+        awake = []
+        for enemy in self.awake:
+            rect = enemy.rect()
+            if sleep_area.colliderect(rect):
+                awake.append(enemy)
+            else:
+                self.sleeping.insert(enemy, rect)
+
+        woken = self.sleeping.query_rect(wake_area) if len(self.sleeping) else []
+        if woken:
+            for enemy in woken:
+                self.sleeping.remove(enemy)
+            awake.extend(woken)
+            order = self.order
+            awake.sort(key=lambda enemy: order[id(enemy)])
+        self.awake = awake
+        return awake
+
+    def rebuild(self, enemies):
+        self.enemies = enemies
+        self.order = {id(enemy): i for i, enemy in enumerate(enemies)}
+        self.awake = []
+        self.sleeping.clear()
+        for enemy in enemies:
+            self.sleeping.insert(enemy, enemy.rect())
+
+    # the enemy was killed, the game removes it from its list as well
+    def remove(self, enemy):
+        if not self.sleeping.remove(enemy) and enemy in self.awake:
+            self.awake.remove(enemy)
+
+    def __len__(self):
+        return len(self.awake)
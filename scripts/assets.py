@@ -0,0 +1,164 @@
+import json
+import threading
+from collections.abc import Mapping
+
+import pygame
+
+from scripts.utils import load_image, load_images, Animation
+from scripts.chunkgrid import ChunkGrid
+from scripts import mapformat, streaming
+
+
+# the one place characters are defined: hitbox size and how far the sprite is drawn from it
+CHARACTERS = {
+    'ninja': {'size': (8, 15), 'anim_offset': (-3, -3),
+              'actions': ['idle', 'run', 'jump', 'slide', 'dash', 'wall_slide']},
+    'knight': {'size': (21, 22), 'anim_offset': (-3, -3),
+               'actions': ['idle', 'run', 'jump', 'slide', 'wall_slide']},
+    'pekka': {'size': (60, 47), 'anim_offset': (0, 0),
+              'actions': ['idle', 'run', 'jump', 'slide', 'wall_slide']},
+}
+DEFAULT_CHARACTER = 'ninja'
+
+CHARACTER_ACTIONS = {'idle': 6, 'run': 4, 'jump': 5, 'slide': 5, 'dash': 5, 'wall_slide': 5}  # action: img_dur
+# drawn instead when a character has no images for an action
+ACTION_FALLBACKS = {'dash': 'run', 'slide': 'wall_slide', 'wall_slide': 'jump', 'jump': 'idle', 'run': 'idle'}
+
+# assets a level needs because of what is placed in its map
+ENEMY_ASSETS = ['enemy/idle', 'enemy/run', 'gun', 'projectile']
+LEAF_ASSETS = ['particle/leaf']
+
+
+# name: (kind, path, options). Nothing is loaded here, only described
+def manifest(character=DEFAULT_CHARACTER):
+    entries = {
+        'decor': ('images', 'tiles/decor', {}),
+        'grass': ('images', 'tiles/grass', {}),
+        'stone': ('images', 'tiles/stone', {}),
+        'large_decor': ('images', 'tiles/large_decor', {}),
+        character: ('image', 'entities/' + character + '.png', {}),
+        'background': ('image', 'background_night.png', {}),
+        'clouds': ('images', 'clouds', {}),
+        'enemy/idle': ('animation', 'entities/enemy/idle', {'img_dur': 6}),
+        'enemy/run': ('animation', 'entities/enemy/run', {'img_dur': 4}),
+        'particle/leaf': ('animation', 'particles/leaf', {'img_dur': 20, 'loop': False}),
+        'particle/particle': ('animation', 'particles/particle', {'img_dur': 6, 'loop': False}),
+        'shuriken': ('image', 'shuriken.png', {}),
+        'gun': ('image', 'gun.png', {}),
+        'projectile': ('image', 'projectile.png', {}),
+    }
+    for action, img_dur in CHARACTER_ACTIONS.items():
+        entries[character + '/' + action] = ('animation', 'entities/' + character + '/' + character_action(character, action), {'img_dur': img_dur})
+    return entries
+
+
+# the action whose images the character shows for action, e.g. knight has no dash and runs instead
+def character_action(character, action):
+    actions = CHARACTERS[character]['actions']
+    while action not in actions:
+        action = ACTION_FALLBACKS[action]
+    return action
+
+
+SOUNDS = {
+    'jump': ('sound', 'assets/sfx/jump.wav', {'volume': 0.7}),
+    'dash': ('sound', 'assets/sfx/dash.wav', {'volume': 0.3}),
+    'hit': ('sound', 'assets/sfx/hit.wav', {'volume': 0.8}),
+    'shoot': ('sound', 'assets/sfx/shoot.wav', {'volume': 0.4}),
+    'ambience': ('sound', 'assets/sfx/ambience.wav', {'volume': 0.2}),
+}
+
+
+def load_entry(kind, path, options):
+    if kind == 'image':
+        return load_image(path)
+    if kind == 'images':
+        return load_images(path)
+    if kind == 'animation':
+        return Animation(load_images(path), **options)
+    if kind == 'sound':
+        sound = pygame.mixer.Sound(path)
+        sound.set_volume(options.get('volume', 1.0))
+        return sound
+    raise ValueError('unknown asset kind: ' + kind)
+
+
+# asset names a map needs, to prefetch them before the level starts
+def level_assets(map_path):
+    if map_path.endswith(mapformat.STREAM_EXTENSION):
+        # a streamed level lists its types in the index, the chunks are not read
+        index = streaming.read_index(map_path)
+        tiles = [(tile_type, None) for tile_type in index['types']]
+        tiles += [(tile['type'], tile['variant']) for tile in index['markers']]
+        return names_for(tiles)
+    if map_path.endswith(mapformat.EXTENSION):
+        grid = ChunkGrid()
+        with open(map_path, 'rb') as f:
+            tile_size, offgrid = mapformat.read_map(f, grid)
+    else:
+        with open(map_path) as f:
+            map_data = json.load(f)
+        grid = mapformat.grid_from_json(map_data)
+        offgrid = map_data['offgrid']
+    tiles = [(grid.type_names[type_id], variant) for x, y, type_id, variant in grid]
+    tiles += [(tile['type'], tile['variant']) for tile in offgrid]
+    return names_for(tiles)
+
+
+# (type, variant) of placed tiles -> asset names
+def names_for(tiles):
+    names = set()
+    for tile_type, variant in tiles:
+        if tile_type == 'character':  # spawners
+            if variant == 1:
+                names.update(ENEMY_ASSETS)
+        else:
+            names.add(tile_type)
+            if tile_type == 'large_decor' and variant == 2:
+                names.update(LEAF_ASSETS)
+    return names
+
+
+class AssetRegistry(Mapping):
+    """
+    Dict-like view of a manifest that loads an asset on first use, e.g. the
+    dash animation on the first set_action('dash'). prefetch() loads assets
+    on a background thread ahead of time, a lookup of an asset that is being
+    prefetched right then waits for it instead of loading it twice
+    """
+    def __init__(self, entries):
+        self.entries = entries
+        self.loaded = {}
+        self.lock = threading.Lock()
+
+    def __getitem__(self, name):
+        asset = self.loaded.get(name)
+        if asset is None:
+            if name not in self.entries:
+                raise KeyError(name)
+            with self.lock:
+                if name not in self.loaded:
+                    self.loaded[name] = load_entry(*self.entries[name])
+                asset = self.loaded[name]
+        return asset
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def prefetch(self, names):
+        names = [name for name in names if name in self.entries and name not in self.loaded]
+        if not names:
+            return None
+        thread = threading.Thread(target=self.load_all, args=(names,), daemon=True)
+        thread.start()
+        return thread
+
+    def load_all(self, names):
+        for name in names:
+            try:
+                self[name]
+            except (OSError, pygame.error):
+                pass  # a missing file shows up when the asset is actually used
@@ -0,0 +1,180 @@
+"""
+Packs every image under assets/images into a few atlas pages, so the game
+decodes a handful of PNGs on startup instead of one per animation frame.
+Build it before making a release (pyinstaller game.spec):
+
+    python -m scripts.atlas
+
+In a source checkout the atlas is also rebuilt on startup whenever an image
+changed. The pages are only rewritten if the content hash of the images
+differs from the one the atlas was built from
+"""
+
+import hashlib
+import json
+import os
+import sys
+
+import pygame
+
+
+IMAGES_PATH = 'assets/images/'
+ATLAS_PATH = 'assets/atlas/'
+INDEX_FILE = 'index.json'
+PAGE_SIZE = 1024  # max width and height of a page
+PADDING = 1  # black (transparent) pixels between images
+
+
+def image_files(root=IMAGES_PATH):
+    files = []
+    for dir_path, dir_names, file_names in os.walk(root):
+        for name in file_names:
+            if name.lower().endswith('.png'):
+                files.append(os.path.relpath(os.path.join(dir_path, name), root).replace(os.sep, '/'))
+    return sorted(files)
+
+
+# cheap fingerprint from sizes and modification times, no file is opened
+def stamp(files, root=IMAGES_PATH):
+    h = hashlib.sha1()
+    for path in files:
+        st = os.stat(root + path)
+        h.update(('%s:%d:%d;' % (path, st.st_size, st.st_mtime_ns)).encode())
+    return h.hexdigest()
+
+
+# hash of the image contents, decides if the pages have to be rewritten
+def content_hash(files, root=IMAGES_PATH):
+    h = hashlib.sha1()
+    for path in files:
+        h.update(path.encode())
+        with open(root + path, 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def read_index(out=ATLAS_PATH):
+    try:
+        with open(out + INDEX_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+# shelf packing: tallest images first, left to right, new shelf when the row is full
+def pack_rects(sizes, page_size=PAGE_SIZE):
+    order = sorted(range(len(sizes)), key=lambda i: (-sizes[i][1], -sizes[i][0]))
+    placements = [None] * len(sizes)  # (page, x, y)
+    pages = []  # [used width, used height]
+    page = x = y = shelf_h = 0
+    for i in order:
+        w, h = sizes[i][0] + PADDING, sizes[i][1] + PADDING
+        if w > page_size or h > page_size:
+            raise ValueError('image %d is larger than an atlas page' % i)
+        if not pages:
+            pages.append([0, 0])
+        if x + w > page_size:
+            x = 0
+            y += shelf_h
+            shelf_h = 0
+        if y + h > page_size:
+            pages.append([0, 0])
+            page += 1
+            x = y = shelf_h = 0
+        placements[i] = (page, x, y)
+        x += w
+        shelf_h = max(shelf_h, h)
+        pages[page][0] = max(pages[page][0], x)
+        pages[page][1] = max(pages[page][1], y + shelf_h)
+    return placements, pages
+
+
+def pack(root=IMAGES_PATH, out=ATLAS_PATH, force=False):
+    files = image_files(root)
+    index = read_index(out)
+    current_stamp = stamp(files, root)
+    if index and not force and index['stamp'] == current_stamp:
+        return index
+
+    digest = content_hash(files, root)
+    if index and not force and index['hash'] == digest:
+        # e.g. a fresh checkout, the images got new mtimes but are the same
+        index['stamp'] = current_stamp
+    else:
+        # convert() needs a display, the pixels end up just like load_image makes them
+        if pygame.display.get_surface() is None:
+            pygame.display.init()
+            pygame.display.set_mode((1, 1), pygame.HIDDEN)
+        images = [pygame.image.load(root + path).convert() for path in files]
+        placements, page_sizes = pack_rects([img.get_size() for img in images])
+
+        pages = [pygame.Surface(size) for size in page_sizes]  # default black
+        rects = {}
+        for path, img, (page, x, y) in zip(files, images, placements):
+            pages[page].blit(img, (x, y))
+            rects[path] = [page, x, y, img.get_width(), img.get_height()]
+
+        os.makedirs(out, exist_ok=True)
+        page_files = []
+        for i, page_surf in enumerate(pages):
+            page_files.append('%s_%d.png' % (digest[:12], i))
+            pygame.image.save(page_surf, out + page_files[-1])
+        # pages of older builds are not needed anymore
+        for name in os.listdir(out):
+            if name.endswith('.png') and name not in page_files:
+                os.remove(out + name)
+        index = {'hash': digest, 'stamp': current_stamp, 'pages': page_files, 'images': rects}
+
+    with open(out + INDEX_FILE, 'w') as f:
+        json.dump(index, f)
+    return index
+
+
+class Atlas:
+    """
+    Runtime side: decodes each page once and hands out subsurfaces of it.
+    Subsurfaces share the pixels and the colorkey of their page
+    """
+    def __init__(self, index, out=ATLAS_PATH):
+        self.pages = []
+        for name in index['pages']:
+            page = pygame.image.load(out + name).convert()
+            page.set_colorkey((0, 0, 0))  # Make pure black transparent
+            self.pages.append(page)
+        self.images = {}  # relative path: subsurface
+        self.dirs = {}  # relative dir: [relative paths sorted by file name]
+        for path, (page, x, y, w, h) in index['images'].items():
+            self.images[path] = self.pages[page].subsurface((x, y, w, h))
+            self.dirs.setdefault(os.path.dirname(path), []).append(path)
+        for paths in self.dirs.values():
+            paths.sort()
+
+    def image(self, path):
+        return self.images.get(path)
+
+    def images_in(self, path):
+        paths = self.dirs.get(path.rstrip('/'))
+        if paths is None:
+            return None
+        return [self.images[p] for p in paths]
+
+
+# the atlas to load images from, None if there is none (the images are loaded one by one then)
+def load_atlas(root=IMAGES_PATH, out=ATLAS_PATH):
+    try:
+        if getattr(sys, 'frozen', False):
+            # release build, the atlas was packed before building
+            index = read_index(out)
+        else:
+            index = pack(root, out)
+        if index is None:
+            return None
+        return Atlas(index, out)
+    except (OSError, ValueError, pygame.error):
+        return None
+
+
+if __name__ == '__main__':
+    force = '--force' in sys.argv
+    index = pack(force=force)
+    print('%d images in %d page(s), hash %s' % (len(index['images']), len(index['pages']), index['hash'][:12]))
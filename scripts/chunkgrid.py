@@ -0,0 +1,97 @@
+from array import array
+
+CHUNK_SHIFT = 4
+CHUNK_SIZE = 1 << CHUNK_SHIFT  # chunks are 16x16 tiles
+CHUNK_MASK = CHUNK_SIZE - 1
+CHUNK_AREA = CHUNK_SIZE * CHUNK_SIZE
+
+EMPTY = -1  # type id of a cell without a tile
+
+
+class Chunk:
+    """
+    A fixed-size block of tiles, stored as two flat arrays
+    indexed by (y % 16) * 16 + (x % 16)
+    """
+    __slots__ = ('types', 'variants', 'count')
+
+    def __init__(self):
+        self.types = array('b', [EMPTY]) * CHUNK_AREA
+        self.variants = array('B', bytes(CHUNK_AREA))
+        self.count = 0  # number of non empty cells, empty chunks are dropped
+
+
+class ChunkGrid:
+    """
+    Sparse tile storage keyed by integer tile coordinates.
+    Tile types are interned to small ints, so a lookup only
+    does some bit math and one dict access for the chunk
+    """
+    def __init__(self):
+        self.chunks = {}  # (chunk_x, chunk_y): Chunk
+        self.type_names = []  # type id -> type name
+        self.type_ids = {}  # type name -> type id
+
+    def type_id(self, name):
+        if name not in self.type_ids:
+            self.type_ids[name] = len(self.type_names)
+            self.type_names.append(name)
+        return self.type_ids[name]
+
+    def clear(self):
+        self.chunks = {}
+
+    def type_at(self, x, y):
+        chunk = self.chunks.get((x >> CHUNK_SHIFT, y >> CHUNK_SHIFT))
+        if chunk is None:
+            return EMPTY
+        return chunk.types[((y & CHUNK_MASK) << CHUNK_SHIFT) | (x & CHUNK_MASK)]
+
+    def variant_at(self, x, y):
+        chunk = self.chunks.get((x >> CHUNK_SHIFT, y >> CHUNK_SHIFT))
+        if chunk is None:
+            return 0
+        return chunk.variants[((y & CHUNK_MASK) << CHUNK_SHIFT) | (x & CHUNK_MASK)]
+
+    def set(self, x, y, type_id, variant):
+        key = (x >> CHUNK_SHIFT, y >> CHUNK_SHIFT)
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            chunk = self.chunks[key] = Chunk()
+        i = ((y & CHUNK_MASK) << CHUNK_SHIFT) | (x & CHUNK_MASK)
+        if chunk.types[i] == EMPTY:
+            chunk.count += 1
+        chunk.types[i] = type_id
+        chunk.variants[i] = variant
+
+    def set_variant(self, x, y, variant):
+        chunk = self.chunks[(x >> CHUNK_SHIFT, y >> CHUNK_SHIFT)]
+        chunk.variants[((y & CHUNK_MASK) << CHUNK_SHIFT) | (x & CHUNK_MASK)] = variant
+
+    def remove(self, x, y):
+        key = (x >> CHUNK_SHIFT, y >> CHUNK_SHIFT)
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            return False
+        i = ((y & CHUNK_MASK) << CHUNK_SHIFT) | (x & CHUNK_MASK)
+        if chunk.types[i] == EMPTY:
+            return False
+        chunk.types[i] = EMPTY
+        chunk.count -= 1
+        if not chunk.count:
+            del self.chunks[key]
+        return True
+
+    # yields (x, y, type_id, variant) for every tile, chunk by chunk
+    def __iter__(self):
+        for (cx, cy), chunk in list(self.chunks.items()):
+            types = chunk.types
+            variants = chunk.variants
+            for i in range(CHUNK_AREA):
+                if types[i] != EMPTY:
+                    yield ((cx << CHUNK_SHIFT) | (i & CHUNK_MASK),
+                           (cy << CHUNK_SHIFT) | (i >> CHUNK_SHIFT),
+                           types[i], variants[i])
+
+    def __len__(self):
+        return sum(chunk.count for chunk in self.chunks.values())
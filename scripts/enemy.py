@@ -1,16 +1,18 @@
-import random
 import math
+import random
 
-import pygame
 from scripts.entity import PhysicsEntity
-from scripts.spark import Spark
-from scripts.particle import Particle
+from scripts.utils import flip_x
+from scripts.projectile import PROJECTILE
 
 
 class Enemy(PhysicsEntity):
     def __init__(self, game, pos, size):
         super().__init__(game, 'enemy', pos, size)
         self.walking = 0  # remaining time units to walk
+        # own generator for its decisions, drawn from the game's: an enemy behaves
+        # the same whether or not the ones far away were asleep meanwhile
+        self.rng = random.Random(game.rng.getrandbits(32))
 
     def update(self, tilemap, movement=(0, 0)):
         if self.walking:
@@ -33,66 +35,61 @@ class Enemy(PhysicsEntity):
                     if (self.flip and dtp[0] < 0):
                         self.game.sfx['shoot'].play()
                         # shoot projectile
-                        self.game.projectiles.append(
-                            [[self.rect().centerx - 7, self.rect().centery], -1.5, 0])
+                        pos = (self.rect().centerx - 7, self.rect().centery)
+                        self.game.projectiles.spawn(PROJECTILE, pos, -1.5)
                         # spawen firing sparks (left)
                         for i in range(4):
-                            self.game.sparks.append(Spark(
-                                self.game.projectiles[-1][0], random.random() - 0.5 + math.pi, 2 + random.random()))
+                            self.game.sparks.spawn(
+                                pos, self.game.rng.random() - 0.5 + math.pi, 2 + self.game.rng.random())
                     if (not self.flip and dtp[0] > 0):
                         self.game.sfx['shoot'].play()
-                        self.game.projectiles.append(
-                            [[self.rect().centerx + 7, self.rect().centery], 1.5, 0])
+                        pos = (self.rect().centerx + 7, self.rect().centery)
+                        self.game.projectiles.spawn(PROJECTILE, pos, 1.5)
                         # spawen firing sparks (right)
                         for i in range(4):
-                            self.game.sparks.append(Spark(
-                                self.game.projectiles[-1][0], random.random() - 0.5, 2 + random.random()))
+                            self.game.sparks.spawn(
+                                pos, self.game.rng.random() - 0.5, 2 + self.game.rng.random())
         # walk randomly for a while if not already walking
-        elif random.random() < 0.01:
-            self.walking = random.randint(30, 120)  # half a sec to 2 sec
+        elif self.rng.random() < 0.01:
+            self.walking = self.rng.randint(30, 120)  # half a sec to 2 sec
         super().update(tilemap, movement=movement)
         if movement[0] != 0:
             self.set_action('run')
         else:
             self.set_action('idle')
             
-        # killed by player dashing
-        if abs(self.game.player.dashing) >= 50:
+        # killed by player dashing, the game finds who is close enough in its entity hash
+        if self in self.game.dash_targets:
             if self.rect().colliderect(self.game.player.rect()):
                 self.game.screenshake = max(16, self.game.screenshake)
                 self.game.sfx['hit'].play()
                 for i in range(30):
-                    angle = random.random() * math.pi * 2
-                    speed = random.random() * 5
-                    self.game.sparks.append(
-                        Spark(self.rect().center, angle, 2 + random.random()))
+                    angle = self.game.rng.random() * math.pi * 2
+                    speed = self.game.rng.random() * 5
+                    self.game.sparks.spawn(self.rect().center, angle, 2 + self.game.rng.random())
                     # angle of particle is opposite
-                    self.game.particles.append(Particle(self.game, 'particle', self.game.player.rect().center, velocity=[
-                        math.cos(angle + math.pi) * speed * 0.5, math.sin(angle + math.pi) * speed * 0.5], frame=random.randint(0, 7)))
+                    self.game.particles.spawn('particle', self.game.player.rect().center, velocity=[
+                        math.cos(angle + math.pi) * speed * 0.5, math.sin(angle + math.pi) * speed * 0.5], frame=self.game.rng.randint(0, 7))
                     # big sparks
-                self.game.sparks.append(
-                    Spark(self.rect().center, 0, 5 + random.random()))
-                self.game.sparks.append(
-                    Spark(self.rect().center, math.pi, 5 + random.random()))
-                return True
-        for shuriken in self.game.shuriken.copy():
-            if self.rect().collidepoint(shuriken[0]):
-                self.game.sfx['hit'].play()
-                self.game.screenshake = max(16, self.game.screenshake)
-                for i in range(30):
-                    angle = random.random() * math.pi * 2
-                    speed = random.random() * 5
-                    self.game.sparks.append(
-                        Spark(self.rect().center, angle, 2 + random.random()))
+                self.game.sparks.spawn(self.rect().center, 0, 5 + self.game.rng.random())
+                self.game.sparks.spawn(self.rect().center, math.pi, 5 + self.game.rng.random())
                 return True
 
+    # killed by a shuriken, the projectile manager removes the enemy afterwards
+    def hit(self):
+        self.game.sfx['hit'].play()
+        self.game.screenshake = max(16, self.game.screenshake)
+        for i in range(30):
+            angle = self.game.rng.random() * math.pi * 2
+            self.game.sparks.spawn(self.rect().center, angle, 2 + self.game.rng.random())
 
     def render(self, surf, offset=(0, 0)):
-        super().render(surf, offset)
+        body_rect = super().render(surf, offset)
         if self.flip:
             # flip gun as well
-            surf.blit(pygame.transform.flip(self.game.assets['gun'], True, False), (self.rect(
+            gun_rect = surf.blit(flip_x(self.game.assets['gun']), (self.rect(
             ).centerx - 4 - self.game.assets['gun'].get_width() - offset[0], self.rect().centery - offset[1]))
         else:
-            surf.blit(self.game.assets['gun'], (self.rect(
+            gun_rect = surf.blit(self.game.assets['gun'], (self.rect(
             ).centerx + 4 - offset[0], self.rect().centery - offset[1]))
+        return body_rect.union(gun_rect)
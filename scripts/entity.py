@@ -1,7 +1,4 @@
 import pygame
-import random
-from scripts.particle import Particle
-from scripts.spark import Spark
 
 
 class PhysicsEntity:
@@ -9,6 +6,7 @@ class PhysicsEntity:
         self.game = game
         self.type = e_type
         self.pos = list(pos)
+        self.prev_pos = list(pos)  # position before the last update, rendering interpolates between the two
         self.size = size
         self.velocity = [0, 0]  # velocity in x and y derection
         self.collisions = {'up': False, 'down': False,
@@ -28,6 +26,52 @@ class PhysicsEntity:
     def rect(self):
         return pygame.Rect(self.pos[0], self.pos[1], self.size[0], self.size[1])
 
+    def move_and_collide(self, tilemap, frame_movement):
+        # handle collisions x and y seperately is recommended
+        # works on the int bounds directly, the same truncation pygame.Rect would do,
+        # and asks the tilemap about solid cells so nothing is allocated per frame
+        tile_size = tilemap.tile_size
+        width, height = self.size
+        offsets = tilemap.neighbor_offsets(width, height)
+
+        # handle collision in x direction
+        self.pos[0] += frame_movement[0]  # update player position
+        left, top = int(self.pos[0]), int(self.pos[1])
+        tile_x, tile_y = int(self.pos[0] // tile_size), int(self.pos[1] // tile_size)
+        for offset_x, offset_y in offsets:
+            if tilemap.solid_at(tile_x + offset_x, tile_y + offset_y):
+                tile_left = (tile_x + offset_x) * tile_size
+                tile_top = (tile_y + offset_y) * tile_size
+                if (left < tile_left + tile_size and left + width > tile_left and
+                        top < tile_top + tile_size and top + height > tile_top):
+                    if frame_movement[0] > 0:  # moving right
+                        left = tile_left - width
+                        self.collisions['right'] = True
+                    if frame_movement[0] < 0:  # moving left
+                        left = tile_left + tile_size
+                        self.collisions['left'] = True
+                    self.pos[0] = left  # attach player to the tile
+                    # why don't use rect to represent the entity's position in the first place?
+                    # reason: rect in pygame only works with int
+
+        # handle collision in y direction
+        self.pos[1] += frame_movement[1]  # update player position
+        left, top = int(self.pos[0]), int(self.pos[1])
+        tile_x, tile_y = int(self.pos[0] // tile_size), int(self.pos[1] // tile_size)
+        for offset_x, offset_y in offsets:
+            if tilemap.solid_at(tile_x + offset_x, tile_y + offset_y):
+                tile_left = (tile_x + offset_x) * tile_size
+                tile_top = (tile_y + offset_y) * tile_size
+                if (left < tile_left + tile_size and left + width > tile_left and
+                        top < tile_top + tile_size and top + height > tile_top):
+                    if frame_movement[1] > 0:  # moving down
+                        top = tile_top - height
+                        self.collisions['down'] = True
+                    if frame_movement[1] < 0:
+                        top = tile_top + tile_size
+                        self.collisions['up'] = True
+                    self.pos[1] = top  # attach player to the tile
+
     def set_action(self, action):
         # only change if different action
         if action != self.action:
@@ -35,44 +79,15 @@ class PhysicsEntity:
             self.animation = self.game.assets[self.type + '/' + self.action].copy() # create a instance of the Animation
 
     def update(self, tilemap, movement=(0, 0)):
+        self.prev_pos[0], self.prev_pos[1] = self.pos
         # collisons are reset every time
-        self.collisions = {'up': False, 'down': False,
-                           'right': False, 'left': False}
+        collisions = self.collisions
+        collisions['up'] = collisions['down'] = collisions['right'] = collisions['left'] = False
         # force(movement) + veclocity = final movement
         frame_movement = (movement[0] + self.velocity[0],
                           movement[1] + self.velocity[1])
 
-        # update pos based on the movement
-        # handle collisions x and y seperately is recommended
-        # handle collision in x direction
-        self.pos[0] += frame_movement[0]  # update player position
-        entity_rect = self.rect()
-        pra = tilemap.physics_rects_around(self.pos, entity_rect.width, entity_rect.height)
-        for rect in pra:
-            if entity_rect.colliderect(rect):
-                if frame_movement[0] > 0:  # moving right
-                    entity_rect.right = rect.left
-                    self.collisions['right'] = True
-                if frame_movement[0] < 0:  # moving left
-                    entity_rect.left = rect.right
-                    self.collisions['left'] = True
-
-                self.pos[0] = entity_rect.x  # attach player to the tile
-                # why don't use rect to represent the entity's position in the first place?
-                # reason: rect in pygame only works with int
-
-        # handle collision in y direction
-        self.pos[1] += frame_movement[1]  # update player position
-        entity_rect = self.rect()
-        for rect in tilemap.physics_rects_around(self.pos, entity_rect.width, entity_rect.height):
-            if entity_rect.colliderect(rect):
-                if frame_movement[1] > 0:  # moving down
-                    entity_rect.bottom = rect.top
-                    self.collisions['down'] = True
-                if frame_movement[1] < 0:
-                    entity_rect.top = rect.bottom
-                    self.collisions['up'] = True
-                self.pos[1] = entity_rect.bottom - entity_rect.height  # attach player to the tile
+        self.move_and_collide(tilemap, frame_movement)
 
         if movement[0] > 0:
             self.flip = False
@@ -99,5 +114,6 @@ class PhysicsEntity:
     def render(self, surf, camera_offset=(0, 0)):
         # offset: camera offset
         # anim_offset: animation offset
-        surf.blit(pygame.transform.flip(self.animation.img(), self.flip, False),
+        # returns the area drawn to, the outline pass reads it back
+        return surf.blit(self.animation.img(self.flip),
                   (self.pos[0] - camera_offset[0] + self.anim_offset[0], self.pos[1] - camera_offset[1] + self.anim_offset[1]))
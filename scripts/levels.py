@@ -0,0 +1,190 @@
+"""
+Level compiler: turns the maps in assets/maps into ready to play bundles
+in assets/levels, plus an index of all levels, so starting a level is
+reading one file. Compiling a level
+
+    autotiles it,
+    takes the spawners out of the map and lists where the player and the
+    enemies start, and lists the leaf emitter rects of the trees,
+    lists the assets it needs, so the next level can be prefetched
+    without reading its map.
+
+Build the bundles before making a release (pyinstaller game.spec):
+
+    python -m scripts.levels
+
+In a source checkout they are also rebuilt on startup and when the editor
+saves, for the levels whose map changed: a level is only compiled again
+if the content hash of its map differs from the one it was compiled from.
+Streamed levels are not bundled, they already keep their spawners in their
+index and are streamed as before
+"""
+
+import json
+import os
+import sys
+
+import pygame
+
+from scripts import mapformat
+from scripts.assets import level_assets, names_for
+from scripts.tilemap import Tilemap
+
+MAPS_PATH = 'assets/maps/'
+LEVELS_PATH = 'assets/levels/'
+INDEX_FILE = 'index.json'
+VERSION = 1
+
+PLAYER_SPAWNER = ('character', 0)
+ENEMY_SPAWNER = ('character', 1)
+LEAF_TREE = ('large_decor', 2)
+
+
+def leaf_rect(tree):
+    # the leafy part of the tree sprite
+    return pygame.Rect(4 + tree['pos'][0], 4 + tree['pos'][1], 23, 13)
+
+
+# takes the spawners out of a loaded map, returns where everything starts
+def extract_level(tilemap):
+    info = {'player': None, 'enemies': [], 'leaf_spawners': []}
+    for tree in tilemap.extract([LEAF_TREE], keep=True):
+        info['leaf_spawners'].append(list(leaf_rect(tree)))
+    for character in tilemap.extract([PLAYER_SPAWNER, ENEMY_SPAWNER]):
+        if (character['type'], character['variant']) == PLAYER_SPAWNER:
+            info['player'] = character['pos']
+        else:
+            info['enemies'].append(character['pos'])
+    return info
+
+
+# compiles one map into a bundle, returns the asset names the level needs
+def compile_map(source, out_path):
+    tilemap = Tilemap(None)
+    tilemap.load(source)
+    tilemap.autotile()
+    info = extract_level(tilemap)
+    grid = tilemap.grid
+    tiles = [(grid.type_names[type_id], variant) for x, y, type_id, variant in grid]
+    tiles += [(tile['type'], tile['variant']) for tile in tilemap.offgrid_tiles]
+    if info['enemies']:
+        tiles.append(ENEMY_SPAWNER)
+    with open(out_path, 'wb') as f:
+        mapformat.write_bundle(f, info, tilemap.tile_size, grid, tilemap.offgrid_tiles)
+    return names_for(tiles)
+
+
+# cheap fingerprint from size and modification time, the file is not opened
+def stamp(path):
+    st = os.stat(path)
+    return '%d:%d' % (st.st_size, st.st_mtime_ns)
+
+
+def read_index(out=LEVELS_PATH):
+    try:
+        with open(out + INDEX_FILE) as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if index.get('version') != VERSION:
+        return None
+    return index
+
+
+def build(maps_dir=MAPS_PATH, out=LEVELS_PATH, force=False):
+    index = read_index(out)
+    old_levels = index['levels'] if index else []
+    levels = []
+    changed = index is None
+    for map_id in range(mapformat.level_count(maps_dir)):
+        source = mapformat.level_path(map_id, maps_dir)
+        old = old_levels[map_id] if map_id < len(old_levels) else None
+        if old is not None and old['source'] != source:
+            old = None
+        if source.endswith(mapformat.STREAM_EXTENSION):
+            entry = {'source': source, 'bundle': None, 'assets': sorted(level_assets(source))}
+        else:
+            entry = old
+            bundle = str(map_id) + mapformat.BUNDLE_EXTENSION
+            current_stamp = stamp(source)
+            fresh = old is not None and not force and old['bundle'] == bundle and os.path.exists(out + bundle)
+            if not fresh or old['stamp'] != current_stamp:
+                digest = mapformat.content_hash(source)
+                if fresh and old['hash'] == digest:
+                    # e.g. a fresh checkout, the maps got new mtimes but are the same
+                    entry = dict(old, stamp=current_stamp)
+                else:
+                    os.makedirs(out, exist_ok=True)
+                    assets = compile_map(source, out + bundle)
+                    entry = {'source': source, 'bundle': bundle, 'stamp': current_stamp, 'hash': digest,
+                             'assets': sorted(assets)}
+        changed = changed or entry != old
+        levels.append(entry)
+
+    # bundles of levels that are gone
+    bundles = set(entry['bundle'] for entry in levels)
+    if os.path.isdir(out):
+        for name in os.listdir(out):
+            if name.endswith(mapformat.BUNDLE_EXTENSION) and name not in bundles:
+                os.remove(out + name)
+                changed = True
+    index = {'version': VERSION, 'levels': levels}
+    if changed or len(levels) != len(old_levels):
+        os.makedirs(out, exist_ok=True)
+        with open(out + INDEX_FILE, 'w') as f:
+            json.dump(index, f)
+    return index
+
+
+class Levels:
+    """
+    The levels the game plays, in order: the file to load for each (its
+    bundle, or the binary version of its map if it has none) and the
+    assets it needs. Without an index the maps are used, like before
+    there were bundles
+    """
+    def __init__(self, index=None, maps_dir=MAPS_PATH, out=LEVELS_PATH):
+        self.out = out
+        if index is None:
+            index = {'levels': [{'source': mapformat.level_path(map_id, maps_dir), 'bundle': None}
+                                for map_id in range(mapformat.level_count(maps_dir))]}
+        self.levels = index['levels']
+
+    def path(self, map_id):
+        entry = self.levels[map_id]
+        if entry['bundle']:
+            return self.out + entry['bundle']
+        if entry['source'].endswith('.json'):
+            try:
+                return mapformat.cached_map(entry['source'])
+            except (OSError, ValueError, KeyError):
+                pass  # e.g. a read only install, the JSON map loads all the same
+        return entry['source']
+
+    def assets(self, map_id):
+        entry = self.levels[map_id]
+        if 'assets' in entry:
+            return set(entry['assets'])
+        return level_assets(entry['source'])
+
+    def __len__(self):
+        return len(self.levels)
+
+
+def load_levels(maps_dir=MAPS_PATH, out=LEVELS_PATH):
+    try:
+        if getattr(sys, 'frozen', False):
+            # release build, the levels were compiled before building
+            index = read_index(out)
+        else:
+            index = build(maps_dir, out)
+    except (OSError, ValueError, mapformat.MapFormatError) as e:
+        print('could not compile the levels, loading the maps: %s' % e, file=sys.stderr)
+        index = None
+    return Levels(index, maps_dir, out)
+
+
+if __name__ == '__main__':
+    index = build(force='--force' in sys.argv)
+    for map_id, entry in enumerate(index['levels']):
+        print('%d: %s -> %s' % (map_id, entry['source'], entry['bundle'] or 'streamed'))
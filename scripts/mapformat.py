@@ -0,0 +1,312 @@
+"""
+Binary map format (.nmap). The JSON maps the editor writes are the source
+of the levels and the only ones checked in; the binary version of a level
+is built from its JSON map into assets/cache/maps, named after the content
+hash of the JSON, so an edited map is never shadowed by an old binary.
+
+    header   magic 'NMAP', version, tile size, counts, CRC-32 of the file
+    types    the tile type names, a tile refers to one by its index
+    chunks   16x16 blocks of the grid, each one either dense (a type and a
+             variant byte per cell, copied straight into the chunk arrays)
+             or sparse (cell, type, variant for each tile) if that is smaller
+    offgrid  type, variant and position of every offgrid tile
+
+A compiled level bundle (.nlvl, see levels.py) is a short header and the
+level info as JSON (spawners, leaf emitters), followed by a binary map.
+
+Convert maps by hand with
+
+    python -m scripts.mapformat convert map.json
+    python -m scripts.mapformat convert map.nmap   (back to JSON)
+    python -m scripts.mapformat bench assets/maps/*.json
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import struct
+import time
+import zlib
+from array import array
+
+from scripts.chunkgrid import ChunkGrid, Chunk, CHUNK_AREA, EMPTY
+
+MAGIC = b'NMAP'
+VERSION = 2
+EXTENSION = '.nmap'
+CACHE_PATH = 'assets/cache/maps/'  # binary versions of the JSON maps, not checked in
+STREAM_EXTENSION = '.stream'  # directory of a level split into chunk files, see streaming.py
+BUNDLE_MAGIC = b'NLVL'
+BUNDLE_VERSION = 1
+BUNDLE_EXTENSION = '.nlvl'
+
+HEADER = struct.Struct('<4sHHHIII')  # magic, version, tile size, types, chunks, offgrid tiles, CRC-32
+CHUNK_HEADER = struct.Struct('<iiBH')  # chunk x, chunk y, dense flag, tile count
+SPARSE_TILE = struct.Struct('<BbB')  # cell, type, variant
+OFFGRID_TILE = struct.Struct('<HBBdd')  # type, variant, int flags, x, y
+BUNDLE_HEADER = struct.Struct('<4sHI')  # magic, version, length of the level info
+CRC_OFFSET = HEADER.size - 4
+
+DENSE = 1
+SPARSE = 0
+# a sparse tile takes 3 bytes, a dense chunk 2 bytes per cell
+SPARSE_LIMIT = CHUNK_AREA * 2 // SPARSE_TILE.size
+
+X_INT = 1  # the position was an int in the JSON map, keep it one
+Y_INT = 2
+
+
+class MapFormatError(Exception):
+    pass
+
+
+# CRC-32 of the header (its own CRC field zeroed) and the body
+def checksum(header, body):
+    return zlib.crc32(body, zlib.crc32(bytes(header[:CRC_OFFSET]) + bytes(4)))
+
+
+def write_map(f, tile_size, grid, offgrid):
+    # only the types actually placed are written, renumbered from 0
+    used = set()
+    for chunk in grid.chunks.values():
+        used.update(t for t in chunk.types if t != EMPTY)
+    for tile in offgrid:
+        used.add(grid.type_id(tile['type']))
+    file_ids = {type_id: i for i, type_id in enumerate(sorted(used))}
+    names = [grid.type_names[type_id].encode() for type_id in sorted(used)]
+    translate = bytearray(range(256))
+    for type_id, file_id in file_ids.items():
+        translate[type_id] = file_id
+
+    chunks = [(key, chunk) for key, chunk in grid.chunks.items() if chunk.count]
+    body = bytearray()
+    for name in names:
+        body += struct.pack('<B', len(name)) + name
+
+    for (cx, cy), chunk in chunks:
+        if chunk.count > SPARSE_LIMIT:
+            body += CHUNK_HEADER.pack(cx, cy, DENSE, chunk.count)
+            # EMPTY is 0xff as a byte, which the table leaves alone
+            body += chunk.types.tobytes().translate(translate)
+            body += chunk.variants.tobytes()
+        else:
+            body += CHUNK_HEADER.pack(cx, cy, SPARSE, chunk.count)
+            for i, type_id in enumerate(chunk.types):
+                if type_id != EMPTY:
+                    body += SPARSE_TILE.pack(i, file_ids[type_id], chunk.variants[i])
+
+    for tile in offgrid:
+        x, y = tile['pos']
+        flags = (X_INT if isinstance(x, int) else 0) | (Y_INT if isinstance(y, int) else 0)
+        body += OFFGRID_TILE.pack(file_ids[grid.type_id(tile['type'])], tile['variant'], flags, x, y)
+
+    header = HEADER.pack(MAGIC, VERSION, tile_size, len(names), len(chunks), len(offgrid), 0)
+    f.write(header[:CRC_OFFSET] + struct.pack('<I', checksum(header, body)))
+    f.write(body)
+
+
+# fills grid (cleared by the caller), returns (tile_size, offgrid tiles).
+# type_id interns a type name, grid.type_id unless the owner of the grid tracks more per type
+def read_map(f, grid, type_id=None):
+    data = f.read()
+    if len(data) < HEADER.size:
+        raise MapFormatError('file too short for a map header')
+    magic, version, tile_size, type_count, chunk_count, offgrid_count, crc = HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise MapFormatError('not a binary map')
+    if version != VERSION:
+        raise MapFormatError('unsupported map version %d' % version)
+    if checksum(data[:HEADER.size], memoryview(data)[HEADER.size:]) != crc:
+        raise MapFormatError('map data is truncated or corrupted')
+    try:
+        return read_body(data, HEADER.size, grid, type_id, tile_size, type_count, chunk_count, offgrid_count)
+    except (struct.error, IndexError, ValueError) as e:
+        # the checksum matched, so the writer made a bad map
+        raise MapFormatError('malformed map: %s' % e)
+
+
+def read_body(data, pos, grid, type_id, tile_size, type_count, chunk_count, offgrid_count):
+    names = []
+    for i in range(type_count):
+        length = data[pos]
+        names.append(data[pos + 1:pos + 1 + length].decode())
+        pos += 1 + length
+    # file type index -> type id of this grid. Types are interned when a chunk uses them,
+    # a type only placed offgrid does not end up in the grid, just like loading the JSON map
+    intern = type_id or grid.type_id
+    type_ids = [None] * type_count
+    translate = bytearray(range(256))
+
+    def grid_id(file_id):
+        if type_ids[file_id] is None:
+            type_ids[file_id] = translate[file_id] = intern(names[file_id])
+        return type_ids[file_id]
+
+    chunks = {}
+    for i in range(chunk_count):
+        cx, cy, dense, count = CHUNK_HEADER.unpack_from(data, pos)
+        pos += CHUNK_HEADER.size
+        chunk = Chunk()
+        if dense:
+            cells = data[pos:pos + CHUNK_AREA]
+            for file_id in set(cells):
+                if file_id != 0xff:  # EMPTY
+                    grid_id(file_id)
+            chunk.types = array('b', cells.translate(translate))
+            chunk.variants = array('B', data[pos + CHUNK_AREA:pos + CHUNK_AREA * 2])
+            pos += CHUNK_AREA * 2
+        else:
+            types, variants = chunk.types, chunk.variants
+            for cell, file_id, variant in SPARSE_TILE.iter_unpack(data[pos:pos + count * SPARSE_TILE.size]):
+                types[cell] = grid_id(file_id)
+                variants[cell] = variant
+            pos += count * SPARSE_TILE.size
+        if len(chunk.types) != CHUNK_AREA or len(chunk.variants) != CHUNK_AREA:
+            raise MapFormatError('chunk %d, %d is cut short' % (cx, cy))
+        chunk.count = count
+        chunks[(cx, cy)] = chunk
+
+    offgrid = []
+    end = pos + offgrid_count * OFFGRID_TILE.size
+    for file_id, variant, flags, x, y in OFFGRID_TILE.iter_unpack(data[pos:end]):
+        offgrid.append({'type': names[file_id], 'variant': variant,
+                        'pos': [int(x) if flags & X_INT else x, int(y) if flags & Y_INT else y]})
+    if end != len(data):
+        raise MapFormatError('map size does not match its header')
+    # only now, a bad map leaves the grid as it was
+    grid.chunks.update(chunks)
+    return tile_size, offgrid
+
+
+def write_bundle(f, info, tile_size, grid, offgrid):
+    info_data = json.dumps(info).encode()
+    f.write(BUNDLE_HEADER.pack(BUNDLE_MAGIC, BUNDLE_VERSION, len(info_data)))
+    f.write(info_data)
+    write_map(f, tile_size, grid, offgrid)
+
+
+# like read_map, returns (tile_size, offgrid tiles, level info)
+def read_bundle(f, grid, type_id=None):
+    header = f.read(BUNDLE_HEADER.size)
+    if len(header) < BUNDLE_HEADER.size:
+        raise MapFormatError('file too short for a bundle header')
+    magic, version, info_length = BUNDLE_HEADER.unpack(header)
+    if magic != BUNDLE_MAGIC:
+        raise MapFormatError('not a level bundle')
+    if version != BUNDLE_VERSION:
+        raise MapFormatError('unsupported bundle version %d' % version)
+    try:
+        info = json.loads(f.read(info_length))
+    except ValueError as e:
+        raise MapFormatError('malformed level info: %s' % e)
+    tile_size, offgrid = read_map(f, grid, type_id)
+    return tile_size, offgrid, info
+
+
+def grid_from_json(map_data):
+    grid = ChunkGrid()
+    for tile in map_data['tilemap'].values():
+        grid.set(int(tile['pos'][0]), int(tile['pos'][1]), grid.type_id(tile['type']), tile['variant'])
+    return grid
+
+
+def json_from_grid(tile_size, grid, offgrid):
+    tilemap = {}
+    for x, y, type_id, variant in grid:
+        tilemap[str(x) + ';' + str(y)] = {'type': grid.type_names[type_id], 'variant': variant, 'pos': [x, y]}
+    return {'tilemap': tilemap, 'tile_size': tile_size, 'offgrid': offgrid}
+
+
+def convert(path, out=None):
+    root, ext = os.path.splitext(path)
+    if ext == '.json':
+        with open(path) as f:
+            map_data = json.load(f)
+        out = out or root + EXTENSION
+        with open(out, 'wb') as f:
+            write_map(f, map_data['tile_size'], grid_from_json(map_data), map_data['offgrid'])
+    elif ext == EXTENSION:
+        grid = ChunkGrid()
+        with open(path, 'rb') as f:
+            tile_size, offgrid = read_map(f, grid)
+        out = out or root + '.json'
+        with open(out, 'w') as f:
+            json.dump(json_from_grid(tile_size, grid, offgrid), f)
+    else:
+        raise MapFormatError('cannot convert ' + path)
+    return out
+
+
+def content_hash(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+# the binary version of a JSON map, built on first use into cache_dir as
+# NAME-HASH-vVERSION.nmap: an edited map or a new format version gets a new
+# file, and the file of the old contents is removed
+def cached_map(json_path, cache_dir=CACHE_PATH):
+    name = os.path.splitext(os.path.basename(json_path))[0]
+    out = '%s%s-%s-v%d%s' % (cache_dir, name, content_hash(json_path), VERSION, EXTENSION)
+    if not os.path.exists(out):
+        os.makedirs(cache_dir, exist_ok=True)
+        for old in os.listdir(cache_dir):
+            if old.endswith(EXTENSION) and old[:-len(EXTENSION)].rsplit('-', 2)[0] == name:
+                os.remove(cache_dir + old)
+        # written under another name first, a half written file is never picked up
+        convert(json_path, out + '.part')
+        os.replace(out + '.part', out)
+    return out
+
+
+# the map file of a level: the streamed one if the level was split, else the JSON one.
+# Binary maps next to the JSON ones are ignored, see cached_map
+def level_path(map_id, maps_dir='assets/maps/'):
+    stream_path = maps_dir + str(map_id) + STREAM_EXTENSION
+    if os.path.isdir(stream_path):
+        return stream_path
+    return maps_dir + str(map_id) + '.json'
+
+
+# levels are numbered from 0, each one has a JSON map and maybe a streamed version
+def level_count(maps_dir='assets/maps/'):
+    ids = set()
+    for name in os.listdir(maps_dir):
+        root, ext = os.path.splitext(name)
+        if root.isdigit() and ext in ('.json', STREAM_EXTENSION):
+            ids.add(int(root))
+    count = 0
+    while count in ids:
+        count += 1
+    return count
+
+
+def bench(paths, repeat=50):
+    for path in paths:
+        root = os.path.splitext(path)[0]
+        binary_path = cached_map(path)
+        start = time.perf_counter()
+        for i in range(repeat):
+            with open(path) as f:
+                grid_from_json(json.load(f))
+        json_time = (time.perf_counter() - start) / repeat
+        start = time.perf_counter()
+        for i in range(repeat):
+            with open(binary_path, 'rb') as f:
+                read_map(f, ChunkGrid())
+        binary_time = (time.perf_counter() - start) / repeat
+        print('%s: json %d bytes %.3f ms, binary %d bytes %.3f ms' % (
+            root, os.path.getsize(path), json_time * 1000, os.path.getsize(binary_path), binary_time * 1000))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='convert and benchmark binary maps')
+    parser.add_argument('command', choices=['convert', 'bench'])
+    parser.add_argument('paths', nargs='+')
+    args = parser.parse_args()
+    if args.command == 'convert':
+        for path in args.paths:
+            print(path, '->', convert(path))
+    else:
+        bench(args.paths)
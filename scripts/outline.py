@@ -0,0 +1,68 @@
+import pygame
+
+try:
+    import numpy
+except ImportError:  # the surfarray path needs numpy, the mask path works without it
+    numpy = None
+
+OUTLINE_OFFSETS = [(-1, 0), (1, 0), (0, -1), (0, 1)]
+OUTLINE_COLOR = (0, 0, 0, 180)
+
+MODES = ['layers', 'surfarray', 'off']
+
+
+class OutlinePass:
+    """
+    Draws the dark outline around everything on the level layer.
+
+    'layers': the static tiles come from masks cached with the baked tile chunks,
+              redrawn only when the camera moves or tiles change; of the dynamic
+              layer only the rects entities, projectiles and sparks drew into are read back
+    'surfarray': one vectorized threshold over the alpha channel of the whole layer (needs numpy)
+    'off': no outline, for low-end machines
+    """
+    def __init__(self, size, mode='layers'):
+        self.mode = mode
+        if self.mode == 'surfarray' and numpy is None:
+            self.mode = 'layers'
+        self.mask = pygame.mask.Mask(size)
+        self.static_mask = pygame.mask.Mask(size)
+        self.static_key = None  # (camera offset, tile cache version) static_mask was made for
+        self.silhouette = pygame.Surface(size, pygame.SRCALPHA)
+
+    def toggle(self):
+        modes = [mode for mode in MODES if mode != 'surfarray' or numpy is not None]
+        self.mode = modes[(modes.index(self.mode) + 1) % len(modes)]
+
+    def static_layer(self, tilemap, offset):
+        key = (offset, tilemap.render_cache.version)
+        if key != self.static_key:
+            self.static_mask.clear()
+            tilemap.render_mask(self.static_mask, offset=offset)
+            self.static_key = key
+        return self.static_mask
+
+    # layer: what gets an outline, target: where the outline is drawn (under the layer)
+    # dirty_rects: where the dynamic objects were drawn on layer this frame
+    def apply(self, layer, target, tilemap, offset, dirty_rects):
+        if self.mode == 'off':
+            return
+        if self.mode == 'surfarray':
+            alpha = pygame.surfarray.pixels_alpha(layer)
+            silhouette_alpha = pygame.surfarray.pixels_alpha(self.silhouette)
+            # same threshold as pygame.mask.from_surface
+            silhouette_alpha[...] = numpy.where(alpha > 127, OUTLINE_COLOR[3], 0)
+            del alpha, silhouette_alpha  # unlock the surfaces
+        else:
+            self.mask.clear()
+            self.mask.draw(self.static_layer(tilemap, offset), (0, 0))
+            layer_rect = layer.get_rect()
+            for rect in dirty_rects:
+                rect = rect.clip(layer_rect)
+                if rect.width and rect.height:
+                    self.mask.draw(pygame.mask.from_surface(layer.subsurface(rect)), rect.topleft)
+            self.mask.to_surface(self.silhouette, setcolor=OUTLINE_COLOR, unsetcolor=(0, 0, 0, 0))
+
+        # draw outline
+        for outline_offset in OUTLINE_OFFSETS:
+            target.blit(self.silhouette, outline_offset)
@@ -1,24 +1,143 @@
-class Particle:
-    def __init__(self, game, p_type, pos, velocity=[0, 0], frame=0) -> None:
+import math
+
+try:
+    import numpy
+except ImportError:  # the columns are then plain lists, updated with list comprehensions
+    numpy = None
+
+SWAY_TYPES = {'leaf'}  # particles that move back and forth while falling
+
+# name: numpy dtype of each column. last is the last animation frame,
+# the particle dies one step after reaching it
+COLUMNS = {'x': 'float64', 'y': 'float64', 'vx': 'float64', 'vy': 'float64',
+           'frame': 'int32', 'last': 'int32', 'type': 'int32', 'sway': 'float64'}
+
+
+class ParticleSystem:
+    """
+    All particles of the level stored as parallel columns (structure of arrays)
+    instead of one object with its own Animation per particle.
+    With numpy the columns are arrays with room to spare, every step updates
+    all of them with a few array operations and dead particles are dropped
+    with one boolean mask. Drawing is a single Surface.blits call
+    """
+    def __init__(self, game, capacity=256):
         self.game = game
-        self.type = p_type
-        self.pos = list(pos)
-        self.velocity = list(velocity)
-        self.animation = self.game.assets['particle/' + p_type].copy()
-        self.animation.frame = frame
+        self.type_ids = {}  # particle type -> type id
+        self.frames = []  # type id -> [(img, half width, half height), ...]
+        self.img_durs = []  # type id -> frames each image is shown
+        self.sways = []  # type id -> sway amplitude
+
+        self.arrays = numpy is not None
+        self.capacity = capacity
+        self.count = 0
+        for name, dtype in COLUMNS.items():
+            setattr(self, name, numpy.zeros(capacity, dtype=dtype) if self.arrays else [])
+        # flags from the last update, dead particles are still drawn once
+        self.kill = numpy.zeros(capacity, dtype=bool) if self.arrays else []
+        self.stepped = 0  # particles [0, stepped) went through the last update
+
+    def type_id(self, p_type):
+        if p_type not in self.type_ids:
+            animation = self.game.assets['particle/' + p_type]
+            self.type_ids[p_type] = len(self.frames)
+            self.frames.append([(img, img.get_width() // 2, img.get_height() // 2) for img in animation.images])
+            self.img_durs.append(animation.img_duration)
+            self.sways.append(0.3 if p_type in SWAY_TYPES else 0)
+        return self.type_ids[p_type]
+
+    def spawn(self, p_type, pos, velocity=(0, 0), frame=0):
+        type_id = self.type_id(p_type)
+        values = (pos[0], pos[1], velocity[0], velocity[1], frame,
+                  self.img_durs[type_id] * len(self.frames[type_id]) - 1, type_id, self.sways[type_id])
+        if not self.arrays:
+            for name, value in zip(COLUMNS, values):
+                getattr(self, name).append(value)
+            self.count += 1
+            return
+        if self.count == self.capacity:
+            self.grow()
+        for name, value in zip(COLUMNS, values):
+            getattr(self, name)[self.count] = value
+        self.kill[self.count] = False
+        self.count += 1
+
+    def grow(self):
+        self.capacity *= 2
+        for name in list(COLUMNS) + ['kill']:
+            column = getattr(self, name)
+            grown = numpy.zeros(self.capacity, dtype=column.dtype)
+            grown[:self.count] = column[:self.count]
+            setattr(self, name, grown)
+
+    def clear(self):
+        if not self.arrays:
+            for name in COLUMNS:
+                getattr(self, name).clear()
+            self.kill = []
+        self.count = 0
+        self.stepped = 0
 
     def update(self):
-        kill = False
-        if self.animation.done:
-            kill = True
-        self.pos[0] += self.velocity[0]
-        self.pos[1] += self.velocity[1]
+        if self.arrays:
+            self.update_arrays()
+        else:
+            self.update_lists()
+
+    def update_arrays(self):
+        n = self.stepped
+        # move particle back and forth naturally, this belongs to the previous
+        # step but is applied now so that step was drawn before the sway
+        self.x[:n] += numpy.sin(self.frame[:n] * 0.035) * self.sway[:n]
+
+        # remove the particles flagged last step with one mask
+        if self.kill[:n].any():
+            keep = ~self.kill[:self.count]
+            alive = int(keep.sum())
+            for name in COLUMNS:
+                column = getattr(self, name)
+                column[:alive] = column[:self.count][keep]
+            self.count = alive
 
-        self.animation.update()
+        # an animation is done once it reached its last frame
+        count = self.count
+        frame, last = self.frame[:count], self.last[:count]
+        self.kill[:count] = frame >= last
+        self.x[:count] += self.vx[:count]
+        self.y[:count] += self.vy[:count]
+        numpy.minimum(frame + 1, last, out=frame)
+        self.stepped = count
 
-        return kill
+    def update_lists(self):
+        n = self.stepped
+        self.x[:n] = [x + math.sin(frame * 0.035) * sway if sway else x
+                      for x, frame, sway in zip(self.x[:n], self.frame, self.sway)]
+
+        if True in self.kill:
+            keep = [i for i, kill in enumerate(self.kill) if not kill] + list(range(n, len(self.x)))
+            for name in COLUMNS:
+                column = getattr(self, name)
+                setattr(self, name, [column[i] for i in keep])
+            self.count = len(keep)
+
+        self.kill = [frame >= last for frame, last in zip(self.frame, self.last)]
+        self.x = [x + vx for x, vx in zip(self.x, self.vx)]
+        self.y = [y + vy for y, vy in zip(self.y, self.vy)]
+        self.frame = [frame + 1 if frame < last else last for frame, last in zip(self.frame, self.last)]
+        self.stepped = self.count
 
     def render(self, surf, offset=(0, 0)):
-        img = self.animation.img()
-        surf.blit(img, (self.pos[0] - offset[0] - img.get_width() //
-                 2, self.pos[1] - offset[1] - img.get_height() // 2))
+        frames = self.frames
+        img_durs = self.img_durs
+        count = self.count
+        columns = [self.x, self.y, self.frame, self.type]
+        if self.arrays:
+            columns = [column[:count].tolist() for column in columns]
+        blit_list = []
+        for x, y, frame, type_id in zip(*columns):
+            img, half_w, half_h = frames[type_id][frame // img_durs[type_id]]
+            blit_list.append((img, (x - offset[0] - half_w, y - offset[1] - half_h)))
+        surf.blits(blit_list, doreturn=False)
+
+    def __len__(self):
+        return self.count
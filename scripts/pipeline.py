@@ -0,0 +1,50 @@
+import pygame
+
+
+class FramePipeline:
+    """
+    Runs the stages of a frame in the order they were added, e.g.
+    input -> simulate -> render world -> post process -> scale -> present.
+    Presenting goes through present(), which allows at most one
+    pygame.display.update per frame. In debug mode that is asserted,
+    so a stray present in the middle of a stage is caught right away.
+    With an enabled profiler every stage is timed as a section
+    """
+    def __init__(self, debug=False, profiler=None):
+        self.debug = debug
+        self.profiler = profiler
+        self.stages = []  # (name, function)
+        self.frame = 0
+        self.presents = 0  # presents in the current frame
+        self.total_presents = 0
+
+    def add_stage(self, name, func):
+        self.stages.append((name, func))
+
+    def run_frame(self):
+        self.presents = 0
+        profiler = self.profiler
+        if profiler is not None and profiler.enabled:
+            profiler.begin_frame()
+            for name, func in self.stages:
+                with profiler.section(name):
+                    func()
+            profiler.end_frame()
+        else:
+            for name, func in self.stages:
+                func()
+        self.frame += 1
+
+    # rects: None updates the whole window, a list of rects only updates those (dirty rects),
+    # an empty list means nothing changed and the window is left alone
+    def present(self, rects=None):
+        if rects is not None and not rects:
+            return
+        self.presents += 1
+        self.total_presents += 1
+        if self.debug:
+            assert self.presents == 1, 'frame %d presented more than once' % self.frame
+        if rects is None:
+            pygame.display.update()
+        else:
+            pygame.display.update(rects)
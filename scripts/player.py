@@ -1,22 +1,15 @@
-import random
 import math
 from scripts.entity import PhysicsEntity
-from scripts.particle import Particle
-
-character_str = 'ninja'
+from scripts.projectile import SHURIKEN
+from scripts.assets import CHARACTERS
 
 class Player(PhysicsEntity):
     def __init__(self, game, pos, size):
-        super().__init__(game, character_str, pos, size)
+        super().__init__(game, game.character, pos, size)
         self.air_time = 0 # tracks how long player's been in the air
         self.jumps = 1 # player can jump once when on the ground/wall
         self.wall_slide = False
-        if character_str == 'ninja':
-            self.anim_offset = (-3, -3)
-        elif character_str == 'knight':
-            self.anim_offset = (-3, -3)
-        else:
-            self.anim_offset = (0, 0)
+        self.anim_offset = CHARACTERS[game.character]['anim_offset']
 
     # update in every frame
     def update(self, tilemap, movement=(0, 0)):
@@ -62,11 +55,10 @@ class Player(PhysicsEntity):
         # burst of particles when dashing at start: 60 or end: 50 of the dash 
         if abs(self.dashing) in {60, 50}:
             for i in range(20):
-                angle = random.random() * math.pi * 2
-                speed = random.random() * 0.5 + 0.5
+                angle = self.game.rng.random() * math.pi * 2
+                speed = self.game.rng.random() * 0.5 + 0.5
                 pvelocity = [math.cos(angle) * speed, math.sin(angle) * speed]
-                self.game.particles.append(
-                    Particle(self.game, 'particle', self.rect().center, velocity=pvelocity, frame=random.randint(0, 7)))
+                self.game.particles.spawn('particle', self.rect().center, velocity=pvelocity, frame=self.game.rng.randint(0, 7))
         
         if self.dashing > 0: 
             self.dashing = max(0, self.dashing-1)
@@ -85,9 +77,8 @@ class Player(PhysicsEntity):
                 # make stream move along
             # particles velocity    
             pvelocity = [abs(self.dashing) /
-                         self.dashing * random.random() * 3, 0]
-            self.game.particles.append(
-                Particle(self.game, 'particle', self.rect().center, velocity=pvelocity, frame=random.randint(0, 7)))
+                         self.dashing * self.game.rng.random() * 3, 0]
+            self.game.particles.spawn('particle', self.rect().center, velocity=pvelocity, frame=self.game.rng.randint(0, 7))
 
         # make wall push back naturally
         # works as air resistance
@@ -121,7 +112,20 @@ class Player(PhysicsEntity):
         
     def attack(self):
         velocity = -7.5 if self.flip else 7.5
-        self.game.shuriken.append([[self.rect().centerx - 7, self.rect().centery], velocity, 0])
+        self.game.projectiles.spawn(SHURIKEN, (self.rect().centerx - 7, self.rect().centery), velocity)
+
+    # hit by an enemy projectile: death
+    def hit(self):
+        self.game.dead += 1
+        self.game.sfx['hit'].play()
+        self.game.screenshake = max(16, self.game.screenshake)
+        for i in range(30):
+            angle = self.game.rng.random() * math.pi * 2
+            speed = self.game.rng.random() * 5
+            self.game.sparks.spawn(self.rect().center, angle, 2 + self.game.rng.random())
+            # angle of particle is opposite
+            self.game.particles.spawn('particle', self.rect().center, velocity=[
+                math.cos(angle + math.pi) * speed * 0.5, math.sin(angle + math.pi) * speed * 0.5], frame=self.game.rng.randint(0, 7))
 
     def dash(self):
         if not self.dashing:
@@ -134,4 +138,4 @@ class Player(PhysicsEntity):
     def render(self, surf, camera_offset=(0, 0)):
         # make player invisible if we are not in the first 10 frames of dashing
         # if abs(self.dashing) <= 50:
-            super().render(surf, camera_offset=camera_offset)
+            return super().render(surf, camera_offset=camera_offset)
@@ -0,0 +1,71 @@
+import pygame
+
+# stretch: scale to fill the window exactly, as before
+# integer: the largest whole multiple that fits, centered with black bars (sharp pixels)
+# scaled: a window of the low resolution with pygame.SCALED, SDL's renderer upscales it
+MODES = ('stretch', 'integer', 'scaled')
+
+
+class Presenter:
+    """
+    Opens the window and puts the low resolution frame on it every frame.
+    Nothing is allocated per frame: the frame is scaled straight into the
+    window (or a fixed area of it), or not scaled here at all in SCALED
+    mode. Screenshake is an offset applied when presenting, in window
+    pixels. screen is the surface to draw window resolution extras on
+    (pause overlay, profiler) after present(); in SCALED mode that is
+    the low resolution window itself
+    """
+    def __init__(self, source_size, window_size, mode='stretch'):
+        if mode not in MODES:
+            raise ValueError('unknown scale mode: %r, expected one of %s' % (mode, ', '.join(MODES)))
+        self.mode = mode
+        self.source_size = source_size
+        if mode == 'scaled':
+            self.screen = pygame.display.set_mode(source_size, pygame.SCALED)
+            self.factor = (window_size[0] / source_size[0], window_size[1] / source_size[1])
+            self.area = self.screen.get_rect()
+        else:
+            self.screen = pygame.display.set_mode(window_size)
+            if mode == 'integer':
+                factor = max(1, min(window_size[0] // source_size[0], window_size[1] // source_size[1]))
+                self.factor = (factor, factor)
+                self.area = pygame.Rect(0, 0, source_size[0] * factor, source_size[1] * factor)
+                self.area.center = (window_size[0] // 2, window_size[1] // 2)
+            else:
+                self.factor = (window_size[0] / source_size[0], window_size[1] / source_size[1])
+                self.area = self.screen.get_rect()
+            # the window area the frame is scaled into, a view, not a copy
+            self.target = self.screen.subsurface(self.area)
+        # black bars around the frame in integer mode
+        window = self.screen.get_rect()
+        self.bars = [rect for rect in [
+            pygame.Rect(0, 0, window.width, self.area.top),
+            pygame.Rect(0, self.area.bottom, window.width, window.height - self.area.bottom),
+            pygame.Rect(0, self.area.top, self.area.left, self.area.height),
+            pygame.Rect(self.area.right, self.area.top, window.width - self.area.right, self.area.height),
+        ] if rect.width > 0 and rect.height > 0]
+
+    # draws the frame onto the window, shifted by offset (window pixels)
+    def present(self, source, offset=(0, 0)):
+        dx, dy = int(offset[0]), int(offset[1])
+        if self.mode == 'scaled':
+            # in low resolution pixels, SDL scales the offset up with everything else
+            self.screen.blit(source, (int(dx / self.factor[0]), int(dy / self.factor[1])))
+            return
+        if self.factor == (1, 1):
+            self.target.blit(source, (0, 0))
+        else:
+            pygame.transform.scale(source, self.area.size, self.target)
+        if dx or dy:
+            # move the scaled frame in place, the uncovered edge keeps its unshifted pixels
+            self.target.scroll(dx, dy)
+        # overlays drawn in window resolution can reach into the bars
+        for rect in self.bars:
+            self.screen.fill((0, 0, 0), rect)
+
+    # window position (e.g. the mouse) -> position on the low resolution frame
+    def to_source(self, pos):
+        if self.mode == 'scaled':
+            return pos  # pygame already reports positions in the low resolution
+        return ((pos[0] - self.area.x) / self.factor[0], (pos[1] - self.area.y) / self.factor[1])
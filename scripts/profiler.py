@@ -0,0 +1,159 @@
+import csv
+import json
+import time
+from collections import deque
+
+import pygame
+
+
+class NullSection:
+    """What section() hands out while profiling is off: entering and leaving it does nothing"""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_SECTION = NullSection()
+
+
+class Section:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        profiler = self.profiler
+        profiler.stack.append(self.name)
+        profiler.starts.append(time.perf_counter())
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        profiler = self.profiler
+        start = profiler.starts.pop()
+        # nested sections are named by their path, e.g. render_world/tiles
+        path = '/'.join(profiler.stack)
+        profiler.stack.pop()
+        profiler.current[path] = profiler.current.get(path, 0) + end - start
+        if profiler.trace is not None and len(profiler.trace) < profiler.max_trace_events:
+            profiler.trace.append((profiler.frame, path, start - profiler.t0, end - start))
+        return False
+
+
+class Profiler:
+    """
+    Times named sections of each frame:
+
+        with profiler.section('tiles'):
+            ...
+
+    The frame pipeline puts every stage in a section, stages put their
+    own parts in nested ones. While disabled, section() returns one shared
+    object that does nothing, so the instrumentation costs next to nothing.
+    Times can go to the overlay, a per-frame history (benchmarks) and a
+    trace file: Chrome trace (.json, open in chrome://tracing) or .csv
+    """
+    def __init__(self, enabled=False, history=False, trace_path=None, window=120, max_trace_events=2000000):
+        self.overlay = False
+        self.trace_path = trace_path
+        self.trace = [] if trace_path else None  # (frame, path, start, duration)
+        self.max_trace_events = max_trace_events
+        self.history = [] if history else None  # {path: seconds} per frame
+        self.enabled = enabled or history or bool(trace_path)
+        self.sections = {}  # name: Section
+        self.stack = []  # names of the open sections
+        self.starts = []  # start times of the open sections
+        self.current = {}  # path: seconds spent in the frame being timed
+        self.last = {}  # path: seconds, last complete frame
+        self.average = {}  # path: seconds, smoothed over recent frames
+        self.frame_times = deque(maxlen=window)  # seconds of work per frame, for the histogram
+        self.frame = 0
+        self.frame_start = 0
+        self.t0 = time.perf_counter()
+
+    def section(self, name):
+        if not self.enabled:
+            return NULL_SECTION
+        section = self.sections.get(name)
+        if section is None:
+            section = self.sections[name] = Section(self, name)
+        return section
+
+    def toggle_overlay(self):
+        self.overlay = not self.overlay
+        self.enabled = self.overlay or self.history is not None or self.trace is not None
+
+    def begin_frame(self):
+        self.current = {}
+        self.frame_start = time.perf_counter()
+
+    def end_frame(self):
+        self.frame_times.append(time.perf_counter() - self.frame_start)
+        self.last = self.current
+        average = self.average
+        for path, seconds in self.current.items():
+            average[path] = average.get(path, seconds) * 0.9 + seconds * 0.1
+        if self.history is not None:
+            self.history.append(self.current)
+        self.frame += 1
+
+    def dump(self, path=None):
+        path = path or self.trace_path
+        if self.trace is None or path is None:
+            return
+        if path.endswith('.csv'):
+            with open(path, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['frame', 'section', 'start_ms', 'duration_ms'])
+                for frame, name, start, duration in self.trace:
+                    writer.writerow([frame, name, '%.4f' % (start * 1000), '%.4f' % (duration * 1000)])
+        else:
+            # complete events, timestamps in microseconds; nesting shows from the times
+            events = [{'name': name.rsplit('/', 1)[-1], 'cat': name, 'ph': 'X', 'pid': 0, 'tid': 0,
+                       'ts': start * 1000000, 'dur': duration * 1000000, 'args': {'frame': frame}}
+                      for frame, name, start, duration in self.trace]
+            with open(path, 'w') as f:
+                json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+
+class ProfilerOverlay:
+    """FPS, a frame time histogram, the time of each section and live object counts, drawn in a corner"""
+    def __init__(self, width=260):
+        self.width = width
+        self.font = None  # created on first use
+        self.background = None
+
+    def render(self, surf, profiler, fps, counts):
+        if self.font is None:
+            self.font = pygame.font.Font(None, 20)
+        average = profiler.average
+        frame_ms = sum(profiler.frame_times) / max(1, len(profiler.frame_times)) * 1000
+        lines = ['FPS %.0f   frame %.2f ms' % (fps, frame_ms)]
+        for path in sorted(average):
+            depth = path.count('/')
+            lines.append('%s%-18s %6.2f ms' % ('  ' * depth, path.rsplit('/', 1)[-1], average[path] * 1000))
+        lines.append('  '.join('%s %d' % item for item in counts.items()))
+
+        line_h = self.font.get_linesize()
+        histogram_h = 40
+        height = len(lines) * line_h + histogram_h + 12
+        if self.background is None or self.background.get_height() != height:
+            self.background = pygame.Surface((self.width, height))
+            self.background.set_alpha(170)
+        surf.blit(self.background, (4, 4))
+
+        y = 8
+        for line in lines:
+            surf.blit(self.font.render(line, True, (255, 255, 255)), (8, y))
+            y += line_h
+
+        # one bar per frame, full height is 33 ms, the line marks 16.7 ms (60 FPS)
+        bottom = y + histogram_h
+        bar_w = max(1, (self.width - 8) // max(1, profiler.frame_times.maxlen))
+        for i, seconds in enumerate(profiler.frame_times):
+            bar_h = min(histogram_h, int(seconds * 1000 / 33.3 * histogram_h))
+            color = (90, 220, 90) if seconds < 1 / 60 else (240, 80, 60)
+            pygame.draw.rect(surf, color, (8 + i * bar_w, bottom - bar_h, bar_w, bar_h))
+        pygame.draw.line(surf, (255, 255, 255), (8, bottom - histogram_h // 2), (self.width, bottom - histogram_h // 2))
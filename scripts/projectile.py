@@ -0,0 +1,119 @@
+import math
+
+PROJECTILE = 0  # enemy bullets, hurt the player
+SHURIKEN = 1  # thrown by the player, hurt enemies
+KIND_ASSETS = ('projectile', 'shuriken')
+
+LIFETIME = 360  # 6 seconds
+
+
+class ProjectileManager:
+    """
+    Owns every enemy projectile and player shuriken in parallel lists, which
+    double in size when they are full, up to max_capacity. A projectile
+    expires when its lifetime is over or it flies into a solid tile. Hits
+    against entities are found in the game's entity hash: each projectile
+    only tests the entities in its own cell
+    """
+    def __init__(self, game, capacity=256, max_capacity=8192):
+        self.game = game
+        self.capacity = capacity
+        self.max_capacity = max_capacity
+        self.count = 0  # live projectiles are in slots [0, count)
+        self.dropped = 0  # spawns refused because max_capacity projectiles were flying
+        self.x = [0.0] * capacity
+        self.y = [0.0] * capacity
+        self.velocity = [0.0] * capacity  # horizontal only
+        self.timer = [0] * capacity
+        self.kind = [PROJECTILE] * capacity
+
+    def grow(self):
+        extra = min(self.capacity, self.max_capacity - self.capacity)
+        self.x.extend([0.0] * extra)
+        self.y.extend([0.0] * extra)
+        self.velocity.extend([0.0] * extra)
+        self.timer.extend([0] * extra)
+        self.kind.extend([PROJECTILE] * extra)
+        self.capacity += extra
+
+    def spawn(self, kind, pos, velocity):
+        if self.count == self.capacity:
+            if self.capacity >= self.max_capacity:
+                self.dropped += 1
+                return False
+            self.grow()
+        i = self.count
+        self.x[i] = pos[0]
+        self.y[i] = pos[1]
+        self.velocity[i] = velocity
+        self.timer[i] = 0
+        self.kind[i] = kind
+        self.count += 1
+        return True
+
+    def clear(self):
+        self.count = 0
+
+    def kill(self, i):
+        # move the last live projectile into the free slot
+        last = self.count - 1
+        self.x[i], self.y[i] = self.x[last], self.y[last]
+        self.velocity[i], self.timer[i], self.kind[i] = self.velocity[last], self.timer[last], self.kind[last]
+        self.count = last
+
+    # moves everything, expires and resolves hits, returns the enemies killed by shuriken
+    def update(self, tilemap, entities, player):
+        x, y, velocity, timer, kind = self.x, self.y, self.velocity, self.timer, self.kind
+        player_hittable = not self.game.dead and abs(player.dashing) < 50  # invincible during dash
+
+        killed = []
+        i = 0
+        while i < self.count:
+            x[i] += velocity[i]
+            timer[i] += 1
+            pos = (x[i], y[i])
+            if not tilemap.streamed_in(pos):
+                # far off the camera on a streamed level
+                self.kill(i)
+                continue
+            if tilemap.solid_check(pos):
+                for j in range(4):
+                    self.game.sparks.spawn(
+                        pos, self.game.rng.random() - 0.5 + (math.pi if velocity[i] > 0 else 0), 2 + self.game.rng.random())
+                self.kill(i)
+                continue
+            if timer[i] > LIFETIME:
+                self.kill(i)
+                continue
+
+            hit = False
+            for entity in entities.query_point(pos):
+                if kind[i] == SHURIKEN and entity is not player:
+                    # shuriken fly through, one can take down several enemies
+                    if entity not in killed:
+                        entity.hit()
+                        killed.append(entity)
+                elif kind[i] == PROJECTILE and entity is player and player_hittable and not self.game.dead:
+                    player.hit()
+                    hit = True
+            if hit:
+                self.kill(i)
+                continue
+            i += 1
+        return killed
+
+    # returns the rects drawn to
+    def render(self, surf, offset=(0, 0)):
+        images = [self.game.assets[name] for name in KIND_ASSETS]
+        half_sizes = [(img.get_width() / 2, img.get_height() / 2) for img in images]
+        blit_list = []
+        for i in range(self.count):
+            half_w, half_h = half_sizes[self.kind[i]]
+            blit_list.append((images[self.kind[i]], (self.x[i] - half_w - offset[0], self.y[i] - half_h - offset[1])))
+        return surf.blits(blit_list)
+
+    def count_kind(self, kind):
+        return self.kind[:self.count].count(kind)
+
+    def __len__(self):
+        return self.count
@@ -0,0 +1,58 @@
+"""
+Input scripts: the gameplay input of a run, keyed by simulation step, plus
+the seed of the game's random generator. Replaying a script with the same
+seed reproduces the run exactly, at any frame rate and without a window
+
+    {"version": 1, "seed": 1234, "steps": 5400,
+     "events": [[12, "right", true], [30, "jump", null], [41, "right", false], ...]}
+
+Actions: left/right (value: pressed or released), jump, attack, dash
+"""
+
+import json
+
+VERSION = 1
+ACTIONS = ('left', 'right', 'jump', 'attack', 'dash')
+
+
+class InputRecorder:
+    def __init__(self, path, seed):
+        self.path = path
+        self.seed = seed
+        self.events = []  # [step, action, value]
+
+    def record(self, step, action, value=None):
+        self.events.append([step, action, value])
+
+    def save(self, steps):
+        with open(self.path, 'w') as f:
+            json.dump({'version': VERSION, 'seed': self.seed, 'steps': steps, 'events': self.events}, f)
+
+
+class InputReplay:
+    """
+    Hands out the recorded input of each step in order. The game applies
+    it right before running that step, just where it was recorded
+    """
+    def __init__(self, path):
+        with open(path) as f:
+            script = json.load(f)
+        if script.get('version') != VERSION:
+            raise ValueError('unsupported input script version: %r' % script.get('version'))
+        for step, action, value in script['events']:
+            if action not in ACTIONS:
+                raise ValueError('unknown action in input script: %r' % action)
+        self.seed = script['seed']
+        self.steps = script['steps']  # length of the recorded run
+        self.events = script['events']
+        self.next = 0  # index of the next event to hand out
+
+    def events_at(self, step):
+        events = []
+        while self.next < len(self.events) and self.events[self.next][0] <= step:
+            events.append(self.events[self.next])
+            self.next += 1
+        return events
+
+    def done(self, step):
+        return step >= self.steps
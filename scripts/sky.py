@@ -0,0 +1,84 @@
+import random
+
+import pygame
+
+
+class CloudBand:
+    """
+    The clouds of one depth range, drawn once into a strip that tiles in
+    both directions. The whole band moves as one: a frame costs a blit of
+    the strip per tile of it on screen (1 to 4), whatever the cloud count
+    """
+    def __init__(self, clouds, size, depth, speed):
+        self.depth = depth  # parallax, 0.5 moves at half the camera speed
+        self.speed = speed  # drift per step
+        self.scroll = 0
+        width, height = size
+        self.strip = pygame.Surface(size)
+        for x, y, img in clouds:
+            # a cloud running over the right or bottom edge comes back in on the other side
+            for dx in (0, -width):
+                for dy in (0, -height):
+                    self.strip.blit(img, (x + dx, y + dy))
+        # mostly empty, run length encoding makes blitting the gaps almost free
+        self.strip.set_colorkey((0, 0, 0), pygame.RLEACCEL)
+
+    def update(self):
+        self.scroll += self.speed
+
+    # where the strip starts on screen, whole pixels
+    def position(self, offset):
+        return (int(self.scroll - offset[0] * self.depth) % self.strip.get_width(),
+                int(-offset[1] * self.depth) % self.strip.get_height())
+
+    def render(self, surf, pos):
+        width, height = self.strip.get_size()
+        for x in range(pos[0] - width, surf.get_width(), width):
+            for y in range(pos[1] - height, surf.get_height(), height):
+                if x + width > 0 and y + height > 0:
+                    surf.blit(self.strip, (x, y))
+
+
+class Sky:
+    """
+    The background image with parallax cloud bands over it, far bands first.
+    Clouds get a random depth and end up in the band covering it. Bands
+    only move in whole pixels, so most frames the sky looks like the one
+    before: it is composed into its own surface and only redrawn when a
+    band moved, otherwise drawing the sky is a single blit
+    """
+    def __init__(self, background, cloud_images, size, count=16, bands=4, rng=random, depth_range=(0.2, 0.8)):
+        # an opaque copy: a colorkey on a picture without holes only makes every blit slower
+        self.background = background.copy()
+        self.background.set_colorkey(None)
+        self.surf = pygame.Surface(size)
+        self.key = None  # band positions the surface was composed for
+        # a strip is a screen plus the biggest cloud, so a cloud shows about once per screen as before
+        strip_size = (size[0] + max(img.get_width() for img in cloud_images),
+                      size[1] + max(img.get_height() for img in cloud_images))
+
+        near, far = depth_range[1], depth_range[0]
+        band_clouds = [[] for i in range(bands)]
+        for i in range(count):
+            x, y = rng.random() * strip_size[0], rng.random() * strip_size[1]
+            img = rng.choice(cloud_images)
+            depth = rng.random() * (near - far) + far
+            band_clouds[min(bands - 1, int((depth - far) / (near - far) * bands))].append((x, y, img))
+        self.bands = []
+        for i, clouds in enumerate(band_clouds):
+            if clouds:
+                depth = far + (i + 0.5) * (near - far) / bands
+                self.bands.append(CloudBand(clouds, strip_size, depth, rng.random() * 0.05 + 0.05))
+
+    def update(self):
+        for band in self.bands:
+            band.update()
+
+    def render(self, surf, offset=(0, 0)):
+        positions = tuple(band.position(offset) for band in self.bands)
+        if positions != self.key:
+            self.key = positions
+            self.surf.blit(self.background, (0, 0))
+            for band, pos in zip(self.bands, positions):
+                band.render(self.surf, pos)
+        surf.blit(self.surf, (0, 0))
@@ -2,25 +2,139 @@ import math
 
 import pygame
 
+try:
+    import numpy
+except ImportError:  # the sparks are then moved and drawn one by one from lists
+    numpy = None
 
-class Spark:
-    def __init__(self, pos, angle, speed) -> None:
-        self.pos = list(pos)
-        self.angle = angle  # polar
-        self.speed = speed
+COLUMNS = ['x', 'y', 'cos', 'sin', 'speed']
+
+
+class SparkPool:
+    """
+    Sparks kept in parallel columns. The direction of a spark never changes,
+    so cos/sin of its angle are computed once on spawn. With numpy the
+    columns are arrays, a step moves all live sparks at once, drops the
+    stopped ones with one mask and computes the 4 vertices of every spark
+    in one go before drawing. Without it dead slots are swapped to the end
+    and each slot owns a 4 point vertex buffer that is rewritten in place
+    """
+    def __init__(self, capacity=256):
+        self.count = 0  # live sparks are in slots [0, count)
+        self.arrays = numpy is not None
+        for name in COLUMNS:
+            setattr(self, name, numpy.zeros(capacity) if self.arrays else [0.0] * capacity)
+        if not self.arrays:
+            self.points = [[[0.0, 0.0] for i in range(4)] for j in range(capacity)]
+
+    def grow(self):
+        extra = len(self.x)
+        if self.arrays:
+            for name in COLUMNS:
+                setattr(self, name, numpy.concatenate((getattr(self, name), numpy.zeros(extra))))
+            return
+        for name in COLUMNS:
+            getattr(self, name).extend([0.0] * extra)
+        self.points.extend([[0.0, 0.0] for i in range(4)] for j in range(extra))
+
+    def spawn(self, pos, angle, speed):
+        if self.count == len(self.x):
+            self.grow()
+        i = self.count
+        self.x[i] = pos[0]
+        self.y[i] = pos[1]
+        self.cos[i] = math.cos(angle)  # polar
+        self.sin[i] = math.sin(angle)
+        self.speed[i] = speed
+        self.count += 1
+
+    def clear(self):
+        self.count = 0
 
     def update(self):
-        self.pos[0] += math.cos(self.angle) * self.speed
-        self.pos[1] += math.sin(self.angle) * self.speed
+        if self.arrays:
+            self.update_arrays()
+        else:
+            self.update_lists()
 
-        self.speed = max(0, self.speed - 0.1)
-        return not self.speed
+    def update_arrays(self):
+        # sparks that stopped last step were drawn once more, drop them now
+        moving = self.speed[:self.count] != 0
+        if not moving.all():
+            alive = int(moving.sum())
+            for name in COLUMNS:
+                column = getattr(self, name)
+                column[:alive] = column[:self.count][moving]
+            self.count = alive
 
+        count = self.count
+        speed = self.speed[:count]
+        self.x[:count] += self.cos[:count] * speed
+        self.y[:count] += self.sin[:count] * speed
+        numpy.maximum(speed - 0.1, 0, out=speed)
+
+    def update_lists(self):
+        x, y, cos, sin, speed = self.x, self.y, self.cos, self.sin, self.speed
+        # recycle the slots of the sparks that stopped last step
+        for i in reversed([i for i in range(self.count) if not speed[i]]):
+            last = self.count - 1
+            x[i], y[i], cos[i], sin[i], speed[i] = x[last], y[last], cos[last], sin[last], speed[last]
+            self.count = last
+
+        for i in range(self.count):
+            x[i] += cos[i] * speed[i]
+            y[i] += sin[i] * speed[i]
+            speed[i] = max(0, speed[i] - 0.1)
+
+    # returns the rects drawn to
     def render(self, surf, offset=(0, 0)):
-        render_points = [
-            (self.pos[0] + math.cos(self.angle) * self.speed * 3 - offset[0], self.pos[1] + math.sin(self.angle) * self.speed * 3 - offset[1]),
-            (self.pos[0] + math.cos(self.angle + math.pi * 0.5) * self.speed * 0.5 - offset[0], self.pos[1] + math.sin(self.angle + math.pi * 0.5) * self.speed * 0.5 - offset[1]),
-            (self.pos[0] + math.cos(self.angle + math.pi) * self.speed * 3 - offset[0], self.pos[1] + math.sin(self.angle + math.pi) * self.speed * 3 - offset[1]),
-            (self.pos[0] + math.cos(self.angle - math.pi * 0.5) * self.speed * 0.5 - offset[0], self.pos[1] + math.sin(self.angle - math.pi * 0.5) * self.speed * 0.5 - offset[1]),
-        ]
-        pygame.draw.polygon(surf, (255, 255, 255), render_points)
+        if self.arrays:
+            return self.render_arrays(surf, offset)
+        x, y, cos, sin, speed = self.x, self.y, self.cos, self.sin, self.speed
+        rects = []
+        for i in range(self.count):
+            px = x[i] - offset[0]
+            py = y[i] - offset[1]
+            long_x = cos[i] * speed[i] * 3
+            long_y = sin[i] * speed[i] * 3
+            # perpendicular to the direction: angle +- pi/2
+            short_x = -sin[i] * speed[i] * 0.5
+            short_y = cos[i] * speed[i] * 0.5
+            points = self.points[i]
+            points[0][0] = px + long_x
+            points[0][1] = py + long_y
+            points[1][0] = px + short_x
+            points[1][1] = py + short_y
+            points[2][0] = px - long_x
+            points[2][1] = py - long_y
+            points[3][0] = px - short_x
+            points[3][1] = py - short_y
+            rects.append(pygame.draw.polygon(surf, (255, 255, 255), points))
+        return rects
+
+    def render_arrays(self, surf, offset):
+        count = self.count
+        if not count:
+            return []
+        px = self.x[:count] - offset[0]
+        py = self.y[:count] - offset[1]
+        cos, sin, speed = self.cos[:count], self.sin[:count], self.speed[:count]
+        long_x = cos * speed * 3
+        long_y = sin * speed * 3
+        short_x = -sin * speed * 0.5
+        short_y = cos * speed * 0.5
+        # (count, 4 vertices, x and y), in the same order as the list path
+        vertices = numpy.empty((count, 4, 2))
+        vertices[:, 0, 0] = px + long_x
+        vertices[:, 0, 1] = py + long_y
+        vertices[:, 1, 0] = px + short_x
+        vertices[:, 1, 1] = py + short_y
+        vertices[:, 2, 0] = px - long_x
+        vertices[:, 2, 1] = py - long_y
+        vertices[:, 3, 0] = px - short_x
+        vertices[:, 3, 1] = py - short_y
+        # the rows go to the draw calls as they are, converting them to lists first is slower
+        return [pygame.draw.polygon(surf, (255, 255, 255), points) for points in vertices]
+
+    def __len__(self):
+        return self.count
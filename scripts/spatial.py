@@ -0,0 +1,104 @@
+import pygame
+
+
+class SpatialHash:
+    """
+    Uniform bucket grid over rects. Every item is stored in each bucket its
+    rect overlaps, so a query only looks at the buckets around the query area.
+    Items are compared by identity, results come back in insertion order
+    """
+    def __init__(self, cell_size=64):
+        self.cell_size = cell_size
+        self.buckets = {}  # (bucket_x, bucket_y): {id(item): item}
+        self.entries = {}  # id(item): (item, rect, seq)
+        self.seq = 0  # insertion counter, keeps results in a stable order
+
+    def cells(self, rect):
+        cell_size = self.cell_size
+        for bx in range(rect.left // cell_size, (rect.right - 1) // cell_size + 1):
+            for by in range(rect.top // cell_size, (rect.bottom - 1) // cell_size + 1):
+                yield (bx, by)
+
+    def insert(self, item, rect):
+        rect = pygame.Rect(rect)
+        self.entries[id(item)] = (item, rect, self.seq)
+        self.seq += 1
+        for cell in self.cells(rect):
+            if cell not in self.buckets:
+                self.buckets[cell] = {}
+            self.buckets[cell][id(item)] = item
+
+    def remove(self, item):
+        entry = self.entries.pop(id(item), None)
+        if entry is None:
+            return False
+        for cell in self.cells(entry[1]):
+            bucket = self.buckets[cell]
+            del bucket[id(item)]
+            if not bucket:
+                del self.buckets[cell]
+        return True
+
+    def clear(self):
+        self.buckets = {}
+        self.entries = {}
+
+    def query_rect(self, rect):
+        rect = pygame.Rect(rect)
+        found = {}
+        for cell in self.cells(rect):
+            bucket = self.buckets.get(cell)
+            if bucket:
+                for key in bucket:
+                    if key not in found:
+                        entry = self.entries[key]
+                        if rect.colliderect(entry[1]):
+                            found[key] = entry
+        return [entry[0] for entry in sorted(found.values(), key=lambda entry: entry[2])]
+
+    def query_point(self, pos):
+        cell_size = self.cell_size
+        bucket = self.buckets.get((int(pos[0] // cell_size), int(pos[1] // cell_size)))
+        if not bucket:
+            return []
+        hits = [self.entries[key] for key in bucket if self.entries[key][1].collidepoint(pos)]
+        return [entry[0] for entry in sorted(hits, key=lambda entry: entry[2])]
+
+    def __iter__(self):
+        for entry in self.entries.values():
+            yield entry[0]
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class EntityHash(SpatialHash):
+    """
+    SpatialHash for things that move. move() only touches the buckets when
+    the rect crosses into other cells, so keeping every entity up to date
+    each step is cheap
+    """
+    def cell_range(self, rect):
+        cell_size = self.cell_size
+        return (rect.left // cell_size, rect.top // cell_size,
+                (rect.right - 1) // cell_size, (rect.bottom - 1) // cell_size)
+
+    def move(self, item, rect):
+        entry = self.entries.get(id(item))
+        if entry is None:
+            self.insert(item, rect)
+            return
+        rect = pygame.Rect(rect)
+        old_rect = entry[1]
+        self.entries[id(item)] = (item, rect, entry[2])  # keeps its place in the order
+        if self.cell_range(old_rect) == self.cell_range(rect):
+            return
+        for cell in self.cells(old_rect):
+            bucket = self.buckets[cell]
+            del bucket[id(item)]
+            if not bucket:
+                del self.buckets[cell]
+        for cell in self.cells(rect):
+            if cell not in self.buckets:
+                self.buckets[cell] = {}
+            self.buckets[cell][id(item)] = item
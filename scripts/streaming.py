@@ -0,0 +1,245 @@
+"""
+Streamed levels: a map split into one file per chunk, so only the part of
+the level around the camera is in memory. A level directory N.stream holds
+
+    index.json     tile size, the chunk files, every type name used and the
+                   markers: spawners and trees, which the game needs for the
+                   whole level as soon as it starts
+    CX_CY.nmap     one 16x16 chunk of the grid plus the offgrid tiles whose
+                   position lies in it, in the binary map format
+
+Split a level with
+
+    python -m scripts.streaming assets/maps/3.json
+"""
+
+import json
+import math
+import os
+import queue
+import sys
+import threading
+from array import array
+from collections import OrderedDict
+
+from scripts import mapformat
+from scripts.chunkgrid import ChunkGrid, CHUNK_SIZE
+
+EXTENSION = mapformat.STREAM_EXTENSION
+INDEX_FILE = 'index.json'
+
+# tiles the game extracts when a level starts. Spawners only live in the index,
+# trees are in the index (leaf spawners) and in their chunk (to be drawn)
+MARKERS = [('character', 0), ('character', 1), ('large_decor', 2)]
+MARKER_ONLY_TYPES = {'character'}
+
+
+def chunk_file(cx, cy):
+    return '%d_%d%s' % (cx, cy, mapformat.EXTENSION)
+
+
+def split_map(path, out_dir=None):
+    if out_dir is None:
+        out_dir = os.path.splitext(path)[0] + EXTENSION
+    grid = ChunkGrid()
+    if path.endswith(mapformat.EXTENSION):
+        with open(path, 'rb') as f:
+            tile_size, offgrid = mapformat.read_map(f, grid)
+    else:
+        with open(path) as f:
+            map_data = json.load(f)
+        grid = mapformat.grid_from_json(map_data)
+        tile_size, offgrid = map_data['tile_size'], map_data['offgrid']
+
+    # same order as Tilemap.extract: offgrid tiles first, then the grid
+    markers = [tile for tile in offgrid if (tile['type'], tile['variant']) in MARKERS]
+    for x, y, type_id, variant in grid:
+        if (grid.type_names[type_id], variant) in MARKERS:
+            markers.append({'type': grid.type_names[type_id], 'variant': variant,
+                            'pos': [x * tile_size, y * tile_size]})
+            if grid.type_names[type_id] in MARKER_ONLY_TYPES:
+                grid.remove(x, y)
+
+    chunk_px = CHUNK_SIZE * tile_size
+    chunk_offgrid = {}
+    for tile in offgrid:
+        if tile['type'] not in MARKER_ONLY_TYPES:
+            key = (math.floor(tile['pos'][0]) // chunk_px, math.floor(tile['pos'][1]) // chunk_px)
+            chunk_offgrid.setdefault(key, []).append(tile)
+
+    os.makedirs(out_dir, exist_ok=True)
+    for name in os.listdir(out_dir):
+        if name.endswith(mapformat.EXTENSION):
+            os.remove(os.path.join(out_dir, name))
+    keys = [key for key, chunk in grid.chunks.items() if chunk.count]
+    keys += [key for key in chunk_offgrid if key not in keys]
+    types = set()
+    for key in keys:
+        sub = ChunkGrid()
+        sub.type_names, sub.type_ids = grid.type_names, grid.type_ids
+        if key in grid.chunks:
+            sub.chunks[key] = grid.chunks[key]
+        tiles = chunk_offgrid.get(key, [])
+        types.update(grid.type_names[type_id] for x, y, type_id, variant in sub)
+        types.update(tile['type'] for tile in tiles)
+        with open(os.path.join(out_dir, chunk_file(*key)), 'wb') as f:
+            mapformat.write_map(f, tile_size, sub, tiles)
+
+    with open(os.path.join(out_dir, INDEX_FILE), 'w') as f:
+        json.dump({'tile_size': tile_size, 'chunks': [list(key) for key in keys],
+                   'types': sorted(types), 'markers': markers}, f)
+    return out_dir
+
+
+def read_index(path):
+    with open(os.path.join(path, INDEX_FILE)) as f:
+        return json.load(f)
+
+
+# parses one chunk file, safe to call from the loader thread
+def read_chunk(path, key):
+    grid = ChunkGrid()
+    with open(os.path.join(path, chunk_file(*key)), 'rb') as f:
+        tile_size, offgrid = mapformat.read_map(f, grid)
+    return grid, offgrid
+
+
+class ChunkStreamer:
+    """
+    Keeps the chunks around the camera of a streamed level in the tilemap.
+    Chunk files are parsed on a background thread and put into the tilemap
+    on the main thread, in update(). At most max_resident chunks stay
+    loaded, the least recently wanted ones are dropped first. A chunk that
+    is needed right away (the player or an awake enemy collides in it) is
+    loaded synchronously
+    """
+    def __init__(self, tilemap, path, margin=1, max_resident=64):
+        self.tilemap = tilemap
+        self.path = path
+        self.margin = margin  # chunks loaded beyond the edge of the view
+        self.max_resident = max_resident
+        index = read_index(path)
+        self.tile_size = index['tile_size']
+        self.chunk_keys = set(tuple(key) for key in index['chunks'])
+        self.markers = index['markers']
+        self.resident = OrderedDict()  # (chunk_x, chunk_y): offgrid tiles of the chunk, least recently wanted first
+        self.pending = set()  # requested from the loader thread, not in yet
+        self.area = None  # (min cx, min cy, max cx, max cy) of the chunks around the camera
+        self.requests = queue.Queue()
+        self.results = queue.Queue()
+        self.thread = threading.Thread(target=self.loader, daemon=True)
+        self.thread.start()
+
+    def loader(self):
+        while True:
+            key = self.requests.get()
+            if key is None:
+                return
+            try:
+                self.results.put((key, read_chunk(self.path, key)))
+            except (OSError, mapformat.MapFormatError) as e:
+                self.results.put((key, e))
+
+    def stop(self):
+        self.requests.put(None)
+
+    def wanted(self, offset, view_size):
+        chunk_px = CHUNK_SIZE * self.tile_size
+        self.area = (int(offset[0] // chunk_px) - self.margin, int(offset[1] // chunk_px) - self.margin,
+                     int((offset[0] + view_size[0]) // chunk_px) + self.margin,
+                     int((offset[1] + view_size[1]) // chunk_px) + self.margin)
+        keys = []
+        for cx in range(self.area[0], self.area[2] + 1):
+            for cy in range(self.area[1], self.area[3] + 1):
+                if (cx, cy) in self.chunk_keys:
+                    keys.append((cx, cy))
+        return keys
+
+    # whether the chunk is one the camera keeps loaded, the rest is not read for projectiles
+    def around_camera(self, cx, cy):
+        area = self.area
+        return area is None or (area[0] <= cx <= area[2] and area[1] <= cy <= area[3])
+
+    # once per frame with the camera offset: request, take in and drop chunks
+    def update(self, offset, view_size):
+        wanted = self.wanted(offset, view_size)
+        for key in wanted:
+            if key in self.resident:
+                self.resident.move_to_end(key)
+            elif key not in self.pending:
+                self.pending.add(key)
+                self.requests.put(key)
+
+        while True:
+            try:
+                key, result = self.results.get_nowait()
+            except queue.Empty:
+                break
+            self.pending.discard(key)
+            if isinstance(result, Exception):
+                print('could not stream chunk %s: %s' % (key, result), file=sys.stderr)
+            elif key not in self.resident:
+                self.add(key, *result)
+
+        wanted = set(wanted)
+        for key in list(self.resident):
+            if len(self.resident) <= self.max_resident:
+                break
+            if key not in wanted:
+                self.drop(key)
+
+    # the chunk is needed now, e.g. for a collision check, load it on this thread
+    def load_now(self, cx, cy):
+        key = (cx, cy)
+        if key not in self.chunk_keys or key in self.resident:
+            return False
+        self.add(key, *read_chunk(self.path, key))
+        return True
+
+    def add(self, key, grid, offgrid):
+        tilemap = self.tilemap
+        # type ids of the chunk file -> type ids of the tilemap
+        translate = bytearray(range(256))
+        for type_id, name in enumerate(grid.type_names):
+            translate[type_id] = tilemap.type_id(name)
+        chunk = grid.chunks.get(key)
+        if chunk is not None:
+            chunk.types = array('b', chunk.types.tobytes().translate(translate))
+            tilemap.grid.chunks[key] = chunk
+        tilemap.offgrid_tiles.extend(offgrid)
+        if tilemap.offgrid_index is not None:
+            for tile in offgrid:
+                tilemap.offgrid_index.insert(tile, tilemap.offgrid_rect(tile))
+        self.resident[key] = offgrid
+        self.invalidate_around(key)
+
+    def drop(self, key):
+        tilemap = self.tilemap
+        offgrid = self.resident.pop(key)
+        tilemap.grid.chunks.pop(key, None)
+        if offgrid:
+            dropped = set(id(tile) for tile in offgrid)
+            tilemap.offgrid_tiles = [tile for tile in tilemap.offgrid_tiles if id(tile) not in dropped]
+            if tilemap.offgrid_index is not None:
+                for tile in offgrid:
+                    tilemap.offgrid_index.remove(tile)
+        self.invalidate_around(key)
+
+    # tiles of a chunk can reach into the baked surfaces of its neighbors
+    def invalidate_around(self, key):
+        cache = self.tilemap.render_cache
+        if cache.chunks:
+            chunk_px = CHUNK_SIZE * self.tile_size
+            cache.invalidate_rect(((key[0] - 1) * chunk_px, (key[1] - 1) * chunk_px, chunk_px * 2, chunk_px * 2))
+
+    # markers matching the pairs, see Tilemap.extract
+    def extract(self, pairs, keep=False):
+        matches = [tile.copy() for tile in self.markers if (tile['type'], tile['variant']) in pairs]
+        if not keep:
+            self.markers = [tile for tile in self.markers if (tile['type'], tile['variant']) not in pairs]
+        return matches
+
+
+if __name__ == '__main__':
+    for path in sys.argv[1:]:
+        print(path, '->', split_map(path))
@@ -0,0 +1,124 @@
+import math
+from collections import OrderedDict
+
+import pygame
+
+from scripts.chunkgrid import CHUNK_SIZE, EMPTY
+
+
+class TileRenderCache:
+    """
+    Pre-composites the static tiles (offgrid first, then on grid) into one
+    surface per chunk, so rendering the map is a few big blits instead of
+    one blit per tile. Chunks are baked lazily when they come into view
+    and re-baked only after a tile touching them changes
+    """
+    def __init__(self, tilemap, max_chunks=64):
+        self.tilemap = tilemap
+        self.max_chunks = max_chunks  # baked chunks kept around, least recently used are dropped
+        self.chunks = OrderedDict()  # (chunk_x, chunk_y): Surface or None if nothing to draw
+        self.masks = {}  # (chunk_x, chunk_y): Mask of the baked surface, made on demand for the outline
+        self.version = 0  # bumped whenever baked chunks are dropped
+        self.drawn = []  # type id -> has art; spawners and other markers are not drawn
+        self.reach = 0  # cells the biggest drawn tile reaches past its own, to the right and down
+
+    def chunk_px(self):
+        return CHUNK_SIZE * self.tilemap.tile_size
+
+    def invalidate_all(self):
+        self.chunks.clear()
+        self.masks.clear()
+        self.version += 1
+        # a new level, maybe another tile size: measure the types again on the next bake
+        self.drawn = []
+        self.reach = 0
+
+    # looks at the types the grid got since the last call, once per level load
+    # unless the editor places a new type
+    def update_types(self):
+        tilemap = self.tilemap
+        assets = tilemap.game.assets
+        for name in tilemap.grid.type_names[len(self.drawn):]:
+            drawn = name in assets
+            self.drawn.append(drawn)
+            if drawn:
+                for img in assets[name]:
+                    self.reach = max(self.reach, (max(img.get_size()) - 1) // tilemap.tile_size)
+
+    # forget every baked chunk overlapping the rect (pixels, world space)
+    def invalidate_rect(self, rect):
+        chunk_px = self.chunk_px()
+        for cx in range(int(rect[0] // chunk_px), int((rect[0] + rect[2]) // chunk_px) + 1):
+            for cy in range(int(rect[1] // chunk_px), int((rect[1] + rect[3]) // chunk_px) + 1):
+                self.chunks.pop((cx, cy), None)
+                self.masks.pop((cx, cy), None)
+        self.version += 1
+
+    def invalidate_tile(self, tile_type, variant, pos):
+        img = self.tilemap.game.assets[tile_type][variant]
+        self.invalidate_rect((pos[0], pos[1], img.get_width(), img.get_height()))
+
+    def bake(self, cx, cy):
+        tilemap = self.tilemap
+        assets = tilemap.game.assets
+        grid = tilemap.grid
+        tile_size = tilemap.tile_size
+        chunk_px = self.chunk_px()
+        area = pygame.Rect(cx * chunk_px, cy * chunk_px, chunk_px, chunk_px)
+        surf = None
+
+        for tile in tilemap.offgrid_in_rect(area):
+            if surf is None:
+                surf = pygame.Surface(area.size, pygame.SRCALPHA)
+            # floor in world space so a tile split over two chunks lines up at the seam
+            surf.blit(assets[tile['type']][tile['variant']],
+                      (math.floor(tile['pos'][0]) - area.x, math.floor(tile['pos'][1]) - area.y))
+
+        if len(self.drawn) != len(grid.type_names):
+            self.update_types()
+        # tiles bigger than a cell can reach in from the chunks to the left and above
+        reach = self.reach
+        drawn = self.drawn
+        type_names = grid.type_names
+        for x in range(cx * CHUNK_SIZE - reach, (cx + 1) * CHUNK_SIZE):
+            for y in range(cy * CHUNK_SIZE - reach, (cy + 1) * CHUNK_SIZE):
+                type_id = grid.type_at(x, y)
+                if type_id != EMPTY and drawn[type_id]:
+                    if surf is None:
+                        surf = pygame.Surface(area.size, pygame.SRCALPHA)
+                    surf.blit(assets[type_names[type_id]][grid.variant_at(x, y)],
+                              (x * tile_size - area.x, y * tile_size - area.y))
+        return surf
+
+    def get(self, cx, cy):
+        key = (cx, cy)
+        if key in self.chunks:
+            self.chunks.move_to_end(key)
+        else:
+            self.chunks[key] = self.bake(cx, cy)
+            if len(self.chunks) > self.max_chunks:
+                self.masks.pop(self.chunks.popitem(last=False)[0], None)
+        return self.chunks[key]
+
+    def visible(self, size, offset):
+        chunk_px = self.chunk_px()
+        for cx in range(offset[0] // chunk_px, (offset[0] + size[0]) // chunk_px + 1):
+            for cy in range(offset[1] // chunk_px, (offset[1] + size[1]) // chunk_px + 1):
+                yield cx, cy
+
+    def render(self, surf, offset=(0, 0)):
+        chunk_px = self.chunk_px()
+        for cx, cy in self.visible(surf.get_size(), offset):
+            chunk_surf = self.get(cx, cy)
+            if chunk_surf is not None:
+                surf.blit(chunk_surf, (cx * chunk_px - offset[0], cy * chunk_px - offset[1]))
+
+    # draws the shape of the visible tiles into mask, like pygame.mask.from_surface would see them
+    def render_mask(self, mask, offset=(0, 0)):
+        chunk_px = self.chunk_px()
+        for cx, cy in self.visible(mask.get_size(), offset):
+            chunk_surf = self.get(cx, cy)
+            if chunk_surf is not None:
+                if (cx, cy) not in self.masks:
+                    self.masks[(cx, cy)] = pygame.mask.from_surface(chunk_surf)
+                mask.draw(self.masks[(cx, cy)], (cx * chunk_px - offset[0], cy * chunk_px - offset[1]))
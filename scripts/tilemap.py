@@ -1,7 +1,20 @@
 import json
+from array import array
+from collections.abc import MutableMapping
+
 import pygame
 import math
 
+try:
+    import numpy
+except ImportError:  # autotile() then goes tile by tile instead of over whole arrays
+    numpy = None
+
+from scripts.chunkgrid import ChunkGrid, CHUNK_SHIFT, CHUNK_SIZE, EMPTY
+from scripts.tilecache import TileRenderCache
+from scripts.spatial import SpatialHash
+from scripts import mapformat, streaming
+
 AUTOTILE_MAP = {
     tuple(sorted([(1, 0), (0, 1)])): 0,
     tuple(sorted([(1, 0), (0, 1), (-1, 0)])): 1,
@@ -14,6 +27,14 @@ AUTOTILE_MAP = {
     tuple(sorted([(1, 0), (-1, 0), (0, 1), (0, -1)])): 8
 }
 
+# one bit per neighbor of the same type, so a neighbor set is a number 0-15
+AUTOTILE_BITS = [(1, (1, 0)), (2, (-1, 0)), (4, (0, -1)), (8, (0, 1))]
+
+# AUTOTILE_MAP indexed by neighbor bitmask, None: the tile keeps its variant
+AUTOTILE_VARIANTS = [None] * 16
+for neighbors, variant in AUTOTILE_MAP.items():
+    AUTOTILE_VARIANTS[sum(bit for bit, shift in AUTOTILE_BITS if shift in neighbors)] = variant
+
 PHYSICS_TILES = {'grass', 'stone'}  # faster than list
 AUTOTILE_TYPES = {'grass', 'stone'}
 
@@ -21,102 +42,309 @@ NEIGHBOR_OFFSETS = [(-1, 0), (-1, -1), (0, -1), (1, -1),
                     (1, 0), (0, 0), (-1, 1), (0, 1), (1, 1)]
 
 
+class TilemapView(MutableMapping):
+    """
+    The old {"x;y": {'type', 'variant', 'pos'}} dictionary, backed by the chunk grid.
+    Used for the json format and code that still works with tile dicts.
+    Returned dicts are copies, write them back with view[loc] = tile
+    """
+    def __init__(self, tilemap):
+        self.tilemap = tilemap
+
+    @staticmethod
+    def parse_loc(loc):
+        x, y = loc.split(';')
+        return int(x), int(y)
+
+    def __getitem__(self, loc):
+        tile = self.tilemap.tile_at(self.parse_loc(loc))
+        if tile is None:
+            raise KeyError(loc)
+        return tile
+
+    def __setitem__(self, loc, tile):
+        self.tilemap.set_tile(self.parse_loc(loc), tile['type'], tile['variant'])
+
+    def __delitem__(self, loc):
+        if not self.tilemap.remove_tile(self.parse_loc(loc)):
+            raise KeyError(loc)
+
+    def __iter__(self):
+        for x, y, type_id, variant in self.tilemap.grid:
+            yield str(x) + ';' + str(y)
+
+    def __len__(self):
+        return len(self.tilemap.grid)
+
+
 class Tilemap:
     def __init__(self, game, tile_size=16):
         self.game = game
         self.tile_size = tile_size # every tile is square with side length of 16 pixels
-        self.tilemap = {}  # every tile on grid, only handle physics on these tiles
+        self.grid = ChunkGrid()  # every tile on grid, only handle physics on these tiles
+        self.solid_types = []  # type id -> is physics tile, grows with grid.type_names
+        self.offsets_cache = {}  # (width, height): neighbor offsets for boxes bigger than a tile
         self.offgrid_tiles = [] # tiles that might be placed off grid
+        self.offgrid_index = None  # SpatialHash over offgrid_tiles, built on the first query
+        self.render_cache = TileRenderCache(self)
+        self.stream = None  # ChunkStreamer of a streamed level, its chunks come and go with the camera
+        self.level_info = None  # spawners and leaf emitters of a compiled level, see levels.py
+
+    @property
+    def tilemap(self):
+        return TilemapView(self)
+
+    def type_id(self, tile_type):
+        type_id = self.grid.type_id(tile_type)
+        while len(self.solid_types) < len(self.grid.type_names):
+            self.solid_types.append(self.grid.type_names[len(self.solid_types)] in PHYSICS_TILES)
+        return type_id
+
+    def tile_at(self, tile_pos):
+        type_id = self.grid.type_at(tile_pos[0], tile_pos[1])
+        if type_id == EMPTY:
+            return None
+        return {'type': self.grid.type_names[type_id],
+                'variant': self.grid.variant_at(tile_pos[0], tile_pos[1]),
+                'pos': [tile_pos[0], tile_pos[1]]}
+
+    def set_tile(self, tile_pos, tile_type, variant=0):
+        self.remove_tile(tile_pos)
+        self.grid.set(int(tile_pos[0]), int(tile_pos[1]), self.type_id(tile_type), variant)
+        self.invalidate_tile(tile_type, variant, tile_pos)
+
+    def remove_tile(self, tile_pos):
+        x, y = int(tile_pos[0]), int(tile_pos[1])
+        type_id = self.grid.type_at(x, y)
+        if type_id == EMPTY:
+            return False
+        self.invalidate_tile(self.grid.type_names[type_id], self.grid.variant_at(x, y), (x, y))
+        return self.grid.remove(x, y)
+
+    # tell the render cache a tile at tile_pos (grid coordinates) changed
+    def invalidate_tile(self, tile_type, variant, tile_pos):
+        if self.render_cache.chunks:
+            self.render_cache.invalidate_tile(tile_type, variant, (tile_pos[0] * self.tile_size, tile_pos[1] * self.tile_size))
+
+    def offgrid_rect(self, tile):
+        img = self.game.assets[tile['type']][tile['variant']]
+        return pygame.Rect(math.floor(tile['pos'][0]), math.floor(tile['pos'][1]), img.get_width(), img.get_height())
+
+    def build_offgrid_index(self):
+        self.offgrid_index = SpatialHash(cell_size=self.tile_size * 4)
+        for tile in self.offgrid_tiles:
+            self.offgrid_index.insert(tile, self.offgrid_rect(tile))
+        return self.offgrid_index
+
+    # offgrid tiles overlapping rect (pixels, world space) in the order they are drawn
+    def offgrid_in_rect(self, rect):
+        index = self.offgrid_index or self.build_offgrid_index()
+        return index.query_rect(rect)
+
+    # offgrid tiles whose image covers pos (pixels, world space)
+    def offgrid_at(self, pos):
+        index = self.offgrid_index or self.build_offgrid_index()
+        return index.query_point(pos)
+
+    def add_offgrid(self, tile):
+        self.offgrid_tiles.append(tile)
+        if self.offgrid_index is not None:
+            self.offgrid_index.insert(tile, self.offgrid_rect(tile))
+        if self.render_cache.chunks:
+            self.render_cache.invalidate_tile(tile['type'], tile['variant'], tile['pos'])
+
+    def remove_offgrid(self, tile):
+        # compare by identity, two decorations can have the same type, variant and pos
+        self.offgrid_tiles = [t for t in self.offgrid_tiles if t is not tile]
+        if self.offgrid_index is not None:
+            self.offgrid_index.remove(tile)
+        if self.render_cache.chunks:
+            self.render_cache.invalidate_tile(tile['type'], tile['variant'], tile['pos'])
 
     # get info about some tiles and keep/delete them
     # type_varient_pairs: (type: string, variant: int)
     def extract(self, type_varient_pair_list, keep=False):
+        if self.stream is not None:
+            # most of a streamed level is not loaded, its index has what the game extracts
+            return self.stream.extract(type_varient_pair_list, keep)
         matches = []
-        for tile in self.offgrid_tiles.copy():
+        kept = []
+        for tile in self.offgrid_tiles:
             if (tile['type'], tile['variant']) in type_varient_pair_list:
                 matches.append(tile.copy())
                 if not keep:
-                    self.offgrid_tiles.remove(tile)
-        # In the video, the tilemap is not wrapped by a list(), which
-        # may cause RuntimeError: dictionary changed size during iteration                    
-        for loc in list(self.tilemap):
-            tile = self.tilemap[loc]
-            if (tile['type'], tile['variant']) in type_varient_pair_list:
-                matches.append(tile.copy())
-                matches[-1]['pos'] = matches[-1]['pos'].copy()
-                matches[-1]['pos'][0] *= self.tile_size
-                matches[-1]['pos'][1] *= self.tile_size
+                    if self.offgrid_index is not None:
+                        self.offgrid_index.remove(tile)
+                    if self.render_cache.chunks:
+                        self.render_cache.invalidate_tile(tile['type'], tile['variant'], tile['pos'])
+                    continue
+            kept.append(tile)
+        self.offgrid_tiles = kept
+        # iterating the grid takes a snapshot of each chunk, so removing is safe
+        type_names = self.grid.type_names
+        for x, y, type_id, variant in self.grid:
+            if (type_names[type_id], variant) in type_varient_pair_list:
+                matches.append({'type': type_names[type_id], 'variant': variant,
+                                'pos': [x * self.tile_size, y * self.tile_size]})
                 if not keep:
-                    del self.tilemap[loc]
-        
+                    self.remove_tile((x, y))
+
         return matches
-    
+
+    # is there a physics tile at tile_x, tile_y (grid coordinates), allocation free
+    def solid_at(self, tile_x, tile_y):
+        type_id = self.grid.type_at(tile_x, tile_y)
+        if type_id == EMPTY and self.stream is not None:
+            # the chunk may just not be streamed in yet
+            if self.stream.load_now(tile_x >> CHUNK_SHIFT, tile_y >> CHUNK_SHIFT):
+                type_id = self.grid.type_at(tile_x, tile_y)
+        return type_id != EMPTY and self.solid_types[type_id]
+
+    # streamed levels: keep the chunks around the camera loaded
+    def stream_around(self, offset, view_size):
+        if self.stream is not None:
+            self.stream.update(offset, view_size)
+
+    # cells (relative to the tile of an entity's top left corner) a box of this size can touch
+    def neighbor_offsets(self, width, height):
+        if width <= self.tile_size and height <= self.tile_size:
+            return NEIGHBOR_OFFSETS
+        key = (width, height)
+        if key not in self.offsets_cache:
+            self.offsets_cache[key] = [(x, y) for x in range(-1, (width - 1) // self.tile_size + 2)
+                                       for y in range(-1, (height - 1) // self.tile_size + 2)]
+        return self.offsets_cache[key]
+
     def solid_check(self, pos):
-        tile_loc = str(int(pos[0] // self.tile_size)) + ';' + str(int(pos[1] // self.tile_size))
-        if tile_loc in self.tilemap:
-            if self.tilemap[tile_loc]['type'] in PHYSICS_TILES:
-                return self.tilemap[tile_loc]
-    
-    def physics_rects_around(self, pos, entity_width, entity_height):
-        rects = []
-        for tile in self.tiles_around(pos):
-            if tile['type'] in PHYSICS_TILES:
-                rects.append(pygame.Rect(tile['pos'][0] * self.tile_size, 
-                                         tile['pos'][1] * self.tile_size, 
-                                         self.tile_size,
-                                         self.tile_size))
-        return rects
-
-    def tiles_around(self, pos):
-        tiles = []
-        tile_loc = (int(pos[0] // self.tile_size),
-                    int(pos[1] // self.tile_size))
-        for offset in NEIGHBOR_OFFSETS:
-            check_loc = str(tile_loc[0] + offset[0]) + \
-                ';' + str(tile_loc[1] + offset[1])
-            if check_loc in self.tilemap:
-                tiles.append(self.tilemap[check_loc])
-        return tiles
-        
-        
+        return self.solid_at(int(pos[0] // self.tile_size), int(pos[1] // self.tile_size))
+
+    # streamed levels: whether pos lies in the chunks kept around the camera. Projectiles
+    # flying beyond them are dropped instead of loading chunks from disk for them
+    def streamed_in(self, pos):
+        if self.stream is None:
+            return True
+        return self.stream.around_camera(int(pos[0] // self.tile_size) >> CHUNK_SHIFT, int(pos[1] // self.tile_size) >> CHUNK_SHIFT)
+
+    # JSON unless the path asks for a binary map. Bundles and streamed levels are
+    # built from a map, saving one directly would lose what they leave out
     def save(self, path):
+        if path.endswith(mapformat.EXTENSION):
+            f = open(path, 'wb')
+            mapformat.write_map(f, self.tile_size, self.grid, self.offgrid_tiles)
+            f.close()
+            return
+        if path.endswith(mapformat.BUNDLE_EXTENSION) or path.endswith(streaming.EXTENSION):
+            raise mapformat.MapFormatError('cannot save to %s, save the map it was built from' % path)
         f = open(path, 'w')
-        json.dump({'tilemap': self.tilemap, 'tile_size': self.tile_size,
+        json.dump({'tilemap': dict(self.tilemap), 'tile_size': self.tile_size,
                   'offgrid': self.offgrid_tiles}, f)
         f.close()
 
     def load(self, path):
-        f = open(path, 'r')
-        map_data = json.load(f)
-        f.close()
-        self.tilemap = map_data['tilemap']
-        self.tile_size = map_data['tile_size']
-        self.offgrid_tiles = map_data['offgrid']
+        self.grid.clear()
+        self.level_info = None
+        if self.stream is not None:
+            self.stream.stop()
+            self.stream = None
+        if path.endswith(mapformat.BUNDLE_EXTENSION):
+            # compiled level, already autotiled and without spawners
+            f = open(path, 'rb')
+            self.tile_size, self.offgrid_tiles, self.level_info = mapformat.read_bundle(f, self.grid, self.type_id)
+            f.close()
+        elif path.endswith(streaming.EXTENSION):
+            # nothing is read yet but the index, stream_around loads the chunks
+            self.stream = streaming.ChunkStreamer(self, path)
+            self.tile_size = self.stream.tile_size
+            self.offgrid_tiles = []
+        elif path.endswith(mapformat.EXTENSION):
+            # binary map, the chunks are read straight into the grid
+            f = open(path, 'rb')
+            self.tile_size, self.offgrid_tiles = mapformat.read_map(f, self.grid, self.type_id)
+            f.close()
+        else:
+            f = open(path, 'r')
+            map_data = json.load(f)
+            f.close()
+            # the "x;y" keys are redundant, pos is the source of truth
+            for tile in map_data['tilemap'].values():
+                self.grid.set(int(tile['pos'][0]), int(tile['pos'][1]), self.type_id(tile['type']), tile['variant'])
+            self.tile_size = map_data['tile_size']
+            self.offgrid_tiles = map_data['offgrid']
+        self.offgrid_index = None
+        self.render_cache.invalidate_all()
+
+    # variant an autotiled tile should have, None if it keeps its own
+    def autotile_variant(self, x, y, type_id):
+        grid = self.grid
+        if grid.type_names[type_id] not in AUTOTILE_TYPES:
+            return None
+        mask = 0
+        for bit, shift in AUTOTILE_BITS:
+            if grid.type_at(x + shift[0], y + shift[1]) == type_id:
+                mask |= bit
+        return AUTOTILE_VARIANTS[mask]
+
+    # after placing or removing the tile at tile_pos only it and its 4 neighbors can change
+    def autotile_around(self, tile_pos):
+        grid = self.grid
+        x, y = int(tile_pos[0]), int(tile_pos[1])
+        for cell_x, cell_y in [(x, y), (x + 1, y), (x - 1, y), (x, y - 1), (x, y + 1)]:
+            type_id = grid.type_at(cell_x, cell_y)
+            if type_id == EMPTY:
+                continue
+            variant = self.autotile_variant(cell_x, cell_y, type_id)
+            old_variant = grid.variant_at(cell_x, cell_y)
+            if variant is not None and variant != old_variant:
+                self.invalidate_tile(grid.type_names[type_id], old_variant, (cell_x, cell_y))
+                grid.set_variant(cell_x, cell_y, variant)
+                self.invalidate_tile(grid.type_names[type_id], variant, (cell_x, cell_y))
 
+    # the whole map at once
     def autotile(self):
-        for loc in self.tilemap:
-            tile = self.tilemap[loc]
-            neighbors = set()
-            for shift in [(1, 0), (-1, 0), (0, -1), (0, 1)]:
-                check_loc = str(tile['pos'][0] + shift[0]) + \
-                    ';' + str(tile['pos'][1] + shift[1])
-                if check_loc in self.tilemap:
-                    if self.tilemap[check_loc]['type'] == tile['type']:
-                        neighbors.add(shift)
-            neighbors = tuple(sorted(neighbors))
-            if (tile['type'] in AUTOTILE_TYPES) and (neighbors in AUTOTILE_MAP):
-                tile['variant'] = AUTOTILE_MAP[neighbors]
+        if numpy is not None:
+            self.autotile_arrays()
+        else:
+            grid = self.grid
+            for x, y, type_id, variant in grid:
+                variant = self.autotile_variant(x, y, type_id)
+                if variant is not None:
+                    grid.set_variant(x, y, variant)
+        self.render_cache.invalidate_all()
+
+    # copies the chunks into one dense array (with a border of empty cells), computes the
+    # neighbor masks of all tiles with four shifted compares and looks them up in one go
+    def autotile_arrays(self):
+        grid = self.grid
+        if not grid.chunks:
+            return
+        min_cx = min(cx for cx, cy in grid.chunks)
+        min_cy = min(cy for cx, cy in grid.chunks)
+        width = (max(cx for cx, cy in grid.chunks) - min_cx + 1) * CHUNK_SIZE
+        height = (max(cy for cx, cy in grid.chunks) - min_cy + 1) * CHUNK_SIZE
+        types = numpy.full((height + 2, width + 2), EMPTY, dtype=numpy.int8)
+        variants = numpy.zeros((height, width), dtype=numpy.uint8)
+        for (cx, cy), chunk in grid.chunks.items():
+            x0, y0 = (cx - min_cx) * CHUNK_SIZE, (cy - min_cy) * CHUNK_SIZE
+            types[y0 + 1:y0 + 1 + CHUNK_SIZE, x0 + 1:x0 + 1 + CHUNK_SIZE] = numpy.frombuffer(chunk.types, dtype=numpy.int8).reshape(CHUNK_SIZE, CHUNK_SIZE)
+            variants[y0:y0 + CHUNK_SIZE, x0:x0 + CHUNK_SIZE] = numpy.frombuffer(chunk.variants, dtype=numpy.uint8).reshape(CHUNK_SIZE, CHUNK_SIZE)
+
+        center = types[1:-1, 1:-1]
+        mask = numpy.zeros(center.shape, dtype=numpy.uint8)
+        for bit, (dx, dy) in AUTOTILE_BITS:
+            mask |= (types[1 + dy:height + 1 + dy, 1 + dx:width + 1 + dx] == center) * numpy.uint8(bit)
+        table = numpy.array([-1 if variant is None else variant for variant in AUTOTILE_VARIANTS], dtype=numpy.int16)
+        new_variants = table[mask]
+        # per type id, the extra last entry is for EMPTY (-1)
+        autotiled = numpy.array([name in AUTOTILE_TYPES for name in grid.type_names] + [False])
+        variants = numpy.where(autotiled[center] & (new_variants >= 0), new_variants, variants).astype(numpy.uint8)
+
+        for (cx, cy), chunk in grid.chunks.items():
+            x0, y0 = (cx - min_cx) * CHUNK_SIZE, (cy - min_cy) * CHUNK_SIZE
+            chunk.variants = array('B', variants[y0:y0 + CHUNK_SIZE, x0:x0 + CHUNK_SIZE].tobytes())
 
     def render(self, surf, offset=(0, 0)):
-        for tile in self.offgrid_tiles:
-            surf.blit(self.game.assets[tile['type']][tile['variant']],
-                      (tile['pos'][0] - offset[0], tile['pos'][1] - offset[1]))
-
-        # optimization of tilemap: only render the tiles need to be shown in display
-        for x in range(offset[0] // self.tile_size, (offset[0] + surf.get_width()) // self.tile_size + 1):
-            for y in range(offset[1] // self.tile_size, (offset[1] + surf.get_height()) // self.tile_size + 1):
-                loc = str(x) + ';' + str(y)
-                if loc in self.tilemap:
-                    tile = self.tilemap[loc]
-                    surf.blit(self.game.assets[tile['type']][tile['variant']], (
-                        tile['pos'][0] * self.tile_size - offset[0], tile['pos'][1] * self.tile_size - offset[1]))
+        # static tiles are pre-baked into chunk surfaces, only the chunks in view are blitted
+        self.render_cache.render(surf, offset=offset)
+
+    def render_mask(self, mask, offset=(0, 0)):
+        self.render_cache.render_mask(mask, offset=offset)
@@ -0,0 +1,31 @@
+class FixedTimestep:
+    """
+    Runs the game logic at a fixed rate no matter how fast frames are drawn.
+    Real time is collected in an accumulator and spent in steps of exactly
+    1/rate seconds, so gravity, dash counters and lifetimes (all counted in
+    steps) behave the same at any frame rate. After a long hitch at most
+    max_steps are run and the rest of the backlog is dropped, the game slows
+    down for a moment instead of freezing to catch up. alpha is how far the
+    next step already is, renderers use it to interpolate positions
+    """
+    def __init__(self, rate=60, max_steps=5):
+        self.step = 1 / rate
+        self.max_steps = max_steps
+        self.accumulator = 0.0
+        self.alpha = 0.0  # 0..1, between the previous and the current step
+
+    # real time passed (seconds) -> number of steps to simulate now
+    def advance(self, dt):
+        self.accumulator += dt
+        steps = int(self.accumulator // self.step)
+        if steps > self.max_steps:
+            steps = self.max_steps
+            self.accumulator = 0.0
+        else:
+            self.accumulator -= steps * self.step
+        self.alpha = self.accumulator / self.step
+        return steps
+
+    def reset(self):
+        self.accumulator = 0.0
+        self.alpha = 0.0
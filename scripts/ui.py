@@ -0,0 +1,39 @@
+import pygame
+
+
+class UIResources:
+    """
+    Surfaces, fonts and texts of the UI, created once and reused every frame
+    instead of being allocated (or loaded from disk) while they are shown
+    """
+    def __init__(self, display_size, screen_size):
+        self.display_size = display_size
+        self.screen_size = screen_size
+        self.transitions = {}  # radius: circle wipe surface
+        self.pause_overlay = None  # created on the first pause
+
+    # black surface with a see-through circle in the middle, for the level transition
+    def transition(self, radius):
+        if radius not in self.transitions:
+            transition_surf = pygame.Surface(self.display_size)
+            pygame.draw.circle(transition_surf, (255, 255, 255), (self.display_size[0] // 2, self.display_size[1] // 2), radius)
+            transition_surf.set_colorkey((255, 255, 255))
+            self.transitions[radius] = transition_surf
+        return self.transitions[radius]
+
+    def render_pause(self, surf):
+        if self.pause_overlay is None:
+            # Draw a semi-transparent overlay
+            self.pause_overlay = pygame.Surface(self.screen_size)
+            self.pause_overlay.fill((100, 100, 100))
+            # Set alpha value for transparency (0-255)
+            self.pause_overlay.set_alpha(128)
+
+            # 120 in the 900 px high window, smaller when the screen is the low resolution one
+            font = pygame.font.Font(None, self.screen_size[1] * 2 // 15)
+            self.paused_text = font.render('Paused', True, (255, 255, 255))
+            self.paused_text_rect = self.paused_text.get_rect(center=(self.screen_size[0] / 2,
+                                                                      self.screen_size[1] / 2 - self.paused_text.get_height() / 2))
+        # Blit overlay on top of the game
+        surf.blit(self.pause_overlay, (0, 0))
+        surf.blit(self.paused_text, self.paused_text_rect)
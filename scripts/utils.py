@@ -2,11 +2,29 @@ import os
 
 import pygame
 
+from scripts.atlas import load_atlas
+
 
 BASE_IMG_PATH = 'assets/images/'
 
 
+atlas = None  # packed images, loaded by the first load_image call
+atlas_loaded = False
+
+
+def get_atlas():
+    global atlas, atlas_loaded
+    if not atlas_loaded:
+        atlas = load_atlas()
+        atlas_loaded = True
+    return atlas
+
+
 def load_image(path):
+    # from the atlas if it has the image, the page was decoded only once
+    img = get_atlas().image(path) if get_atlas() else None
+    if img is not None:
+        return img
     # make rendering more efficient
     img = pygame.image.load(BASE_IMG_PATH + path).convert()
     img.set_colorkey((0, 0, 0))  # Make pure black transparent
@@ -14,27 +32,41 @@ def load_image(path):
 
 
 def load_images(path):
+    images = get_atlas().images_in(path) if get_atlas() else None
+    if images is not None:
+        return images
     images = []
     for img_name in sorted(os.listdir(BASE_IMG_PATH + path)):
         images.append(load_image(path + '/' + img_name))
     return images
 
 
+flipped_images = {}  # surface: the same surface mirrored horizontally
+
+
+# mirrored copy of a sprite, made once and reused instead of flipping every frame
+def flip_x(img):
+    if img not in flipped_images:
+        flipped_images[img] = pygame.transform.flip(img, True, False)
+    return flipped_images[img]
+
 
 class Animation:
     """
     Animation is all about just showing different 
     images at different times
     """
-    def __init__(self, images, img_dur=5, loop=True):
+    def __init__(self, images, img_dur=5, loop=True, flipped=None):
         self.images = images
+        # mirrored images, made for the asset and handed on to its copies
+        self.flipped = flipped if flipped is not None else [flip_x(img) for img in images]
         self.loop = loop # if we want the animation to loop
         self.img_duration = img_dur # how many frames we want each image to show
         self.done = False
         self.frame = 0
 
     def copy(self):
-        return Animation(self.images, self.img_duration, self.loop)
+        return Animation(self.images, self.img_duration, self.loop, self.flipped)
     
     def update(self):
         # not a simple frame++ or index error
@@ -45,8 +77,8 @@ class Animation:
             if self.frame >= self.img_duration * len(self.images) - 1:
                 self.done = True
     
-    # get the current image of the animation            
-    def img(self):
+    # get the current image of the animation, mirrored if flip is set
+    def img(self, flip=False):
         # will increase by 1 every single time as frames increases
         # division gives us the index of the imag we should have
-        return self.images[int(self.frame / self.img_duration)]
+        return (self.flipped if flip else self.images)[int(self.frame / self.img_duration)]
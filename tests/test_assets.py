@@ -0,0 +1,20 @@
+import os
+
+import pytest
+
+from scripts.assets import manifest, CHARACTERS, CHARACTER_ACTIONS
+
+IMAGES = os.path.join(os.path.dirname(__file__), '..', 'assets', 'images')
+
+
+@pytest.mark.parametrize('character', sorted(CHARACTERS))
+def test_manifest_paths_exist(character):
+    entries = manifest(character)
+    for action in CHARACTER_ACTIONS:
+        assert character + '/' + action in entries
+    for name, (kind, path, options) in entries.items():
+        path = os.path.join(IMAGES, path)
+        if kind == 'image':
+            assert os.path.isfile(path), name
+        else:
+            assert os.path.isdir(path) and os.listdir(path), name
@@ -0,0 +1,64 @@
+import random
+
+from scripts import tilemap as tilemap_module
+from scripts.tilemap import Tilemap, AUTOTILE_MAP, AUTOTILE_TYPES
+
+TYPES = ['grass', 'stone', 'decor']
+
+
+def random_map(seed):
+    rng = random.Random(seed)
+    tilemap = Tilemap(None)
+    for i in range(1500):
+        tilemap.set_tile((rng.randint(-40, 40), rng.randint(-30, 30)), rng.choice(TYPES), rng.randint(0, 8))
+    return tilemap
+
+
+def tiles(tilemap):
+    return sorted((x, y, tilemap.grid.type_names[type_id], variant) for x, y, type_id, variant in tilemap.grid)
+
+
+# the original autotile: the sorted offsets of same type neighbors, looked up in AUTOTILE_MAP
+def brute_force(tilemap):
+    expected = []
+    for x, y, tile_type, variant in tiles(tilemap):
+        neighbors = set()
+        for shift in [(1, 0), (-1, 0), (0, -1), (0, 1)]:
+            neighbor = tilemap.tile_at((x + shift[0], y + shift[1]))
+            if neighbor and neighbor['type'] == tile_type:
+                neighbors.add(shift)
+        neighbors = tuple(sorted(neighbors))
+        if tile_type in AUTOTILE_TYPES and neighbors in AUTOTILE_MAP:
+            variant = AUTOTILE_MAP[neighbors]
+        expected.append((x, y, tile_type, variant))
+    return expected
+
+
+def test_autotile_arrays_matches_brute_force():
+    tilemap = random_map(1)
+    expected = brute_force(tilemap)
+    tilemap.autotile()
+    assert tiles(tilemap) == expected
+
+
+def test_autotile_without_numpy_matches_brute_force(monkeypatch):
+    monkeypatch.setattr(tilemap_module, 'numpy', None)
+    tilemap = random_map(2)
+    expected = brute_force(tilemap)
+    tilemap.autotile()
+    assert tiles(tilemap) == expected
+
+
+def test_autotile_around_matches_whole_map():
+    rng = random.Random(3)
+    tilemap = random_map(3)
+    tilemap.autotile()
+    # paint and erase like the editor does, the map stays autotiled
+    for i in range(500):
+        pos = (rng.randint(-40, 40), rng.randint(-30, 30))
+        if rng.random() < 0.7:
+            tilemap.set_tile(pos, rng.choice(TYPES), 0)
+        else:
+            tilemap.remove_tile(pos)
+        tilemap.autotile_around(pos)
+    assert tiles(tilemap) == brute_force(tilemap)
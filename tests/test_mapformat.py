@@ -0,0 +1,119 @@
+import glob
+import io
+import json
+import os
+
+import pytest
+
+from scripts import mapformat
+from scripts.chunkgrid import ChunkGrid
+from scripts.tilemap import Tilemap
+
+MAPS = sorted(glob.glob(os.path.join(os.path.dirname(__file__), '..', 'assets', 'maps', '*.json')))
+
+
+def tiles_of(map_data):
+    return sorted((int(tile['pos'][0]), int(tile['pos'][1]), tile['type'], tile['variant'])
+                  for tile in map_data['tilemap'].values())
+
+
+def binary_of(map_data):
+    f = io.BytesIO()
+    mapformat.write_map(f, map_data['tile_size'], mapformat.grid_from_json(map_data), map_data['offgrid'])
+    return f.getvalue()
+
+
+def read(data):
+    return mapformat.read_map(io.BytesIO(data), ChunkGrid())
+
+
+@pytest.mark.parametrize('path', MAPS)
+def test_json_binary_json_round_trip(path, tmp_path):
+    with open(path) as f:
+        map_data = json.load(f)
+    binary = mapformat.convert(path, str(tmp_path / 'map.nmap'))
+    back = mapformat.convert(binary, str(tmp_path / 'map.json'))
+    with open(back) as f:
+        round_trip = json.load(f)
+    assert round_trip['tile_size'] == map_data['tile_size']
+    assert tiles_of(round_trip) == tiles_of(map_data)
+    # positions keep being ints or floats, as in the JSON map
+    assert round_trip['offgrid'] == [dict(tile, pos=list(tile['pos'])) for tile in map_data['offgrid']]
+
+
+def test_every_truncation_is_rejected():
+    with open(MAPS[0]) as f:
+        data = binary_of(json.load(f))
+    for length in range(len(data)):
+        with pytest.raises(mapformat.MapFormatError):
+            read(data[:length])
+
+
+def test_every_corrupted_byte_is_rejected():
+    with open(MAPS[0]) as f:
+        data = binary_of(json.load(f))
+    for i in range(len(data)):
+        corrupted = bytearray(data)
+        corrupted[i] ^= 0x10
+        with pytest.raises(mapformat.MapFormatError):
+            read(bytes(corrupted))
+
+
+def test_trailing_data_is_rejected():
+    with open(MAPS[0]) as f:
+        data = binary_of(json.load(f))
+    with pytest.raises(mapformat.MapFormatError):
+        read(data + b'\0')
+
+
+def test_cached_map_follows_the_json(tmp_path):
+    source = tmp_path / '0.json'
+    with open(MAPS[0]) as f:
+        map_data = json.load(f)
+    source.write_text(json.dumps(map_data))
+    cache_dir = str(tmp_path / 'cache') + '/'
+    first = mapformat.cached_map(str(source), cache_dir)
+    assert mapformat.cached_map(str(source), cache_dir) == first
+
+    # an edit gets a new binary, the old one is gone
+    map_data['tilemap']['1000;1000'] = {'type': 'stone', 'variant': 0, 'pos': [1000, 1000]}
+    source.write_text(json.dumps(map_data))
+    second = mapformat.cached_map(str(source), cache_dir)
+    assert second != first and not os.path.exists(first)
+    with open(second, 'rb') as f:
+        grid = ChunkGrid()
+        mapformat.read_map(f, grid)
+    assert grid.type_names[grid.type_at(1000, 1000)] == 'stone'
+
+
+def test_levels_load_from_json_not_a_stale_binary(tmp_path):
+    maps_dir = str(tmp_path) + '/'
+    with open(MAPS[0]) as f:
+        (tmp_path / '0.json').write_text(f.read())
+    # an old binary next to the map, newer than it
+    (tmp_path / '0.nmap').write_bytes(b'stale')
+    assert mapformat.level_count(maps_dir) == 1
+    assert mapformat.level_path(0, maps_dir) == maps_dir + '0.json'
+
+
+def test_tilemap_saves_binary_maps(tmp_path):
+    tilemap = Tilemap(None)
+    tilemap.load(MAPS[0])
+    tilemap.save(str(tmp_path / 'map.nmap'))
+    loaded = Tilemap(None)
+    loaded.load(str(tmp_path / 'map.nmap'))
+    assert sorted(loaded.tilemap.values(), key=str) == sorted(tilemap.tilemap.values(), key=str)
+    with pytest.raises(mapformat.MapFormatError):
+        tilemap.save(str(tmp_path / 'map.nlvl'))
+
+
+def test_damaged_level_info_is_rejected():
+    with open(MAPS[0]) as f:
+        map_data = json.load(f)
+    f = io.BytesIO()
+    mapformat.write_bundle(f, {'spawners': []}, map_data['tile_size'], mapformat.grid_from_json(map_data), [])
+    data = f.getvalue()
+    start = mapformat.BUNDLE_HEADER.size
+    for damaged in (data[:start] + b'[' + data[start + 1:], data[:start] + b'\xff' + data[start + 1:]):
+        with pytest.raises(mapformat.MapFormatError):
+            mapformat.read_bundle(io.BytesIO(damaged), ChunkGrid())
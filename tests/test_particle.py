@@ -0,0 +1,45 @@
+import random
+
+import pygame
+import pytest
+
+from scripts import particle
+from scripts.particle import ParticleSystem
+
+
+class Animation:
+    def __init__(self, frames, img_duration):
+        self.images = [pygame.Surface((w, w)) for w in range(3, 3 + frames)]
+        self.img_duration = img_duration
+
+
+class Game:
+    assets = {'particle/leaf': Animation(18, 20), 'particle/particle': Animation(4, 6)}
+
+
+def run(seed):
+    rng = random.Random(seed)
+    particles = ParticleSystem(Game(), capacity=8)
+    states = []
+    for step in range(400):
+        for i in range(rng.randint(0, 6)):
+            p_type = rng.choice(['leaf', 'particle'])
+            particles.spawn(p_type, (rng.uniform(-50, 50), rng.uniform(-50, 50)),
+                            velocity=(rng.uniform(-1, 1), rng.uniform(-1, 1)), frame=rng.randint(0, 20))
+        particles.update()
+        states.append([list(column[:len(particles)]) for column in
+                       (particles.x, particles.y, particles.frame, particles.type)])
+        if step == 200:
+            particles.clear()
+    return states
+
+
+def test_arrays_match_lists(monkeypatch):
+    arrays = run(1)
+    monkeypatch.setattr(particle, 'numpy', None)
+    lists = run(1)
+    assert len(arrays) == len(lists)
+    for array_state, list_state in zip(arrays, lists):
+        x, y, frame, type_ids = array_state
+        assert x == pytest.approx(list_state[0])
+        assert y == list_state[1] and frame == list_state[2] and type_ids == list_state[3]
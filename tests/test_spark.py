@@ -0,0 +1,31 @@
+import math
+import random
+
+import pygame
+
+from scripts import spark
+from scripts.spark import SparkPool
+
+
+def run(seed):
+    rng = random.Random(seed)
+    sparks = SparkPool(capacity=4)
+    surf = pygame.Surface((200, 200))
+    states = []
+    for step in range(200):
+        for i in range(rng.randint(0, 5)):
+            sparks.spawn((rng.uniform(0, 200), rng.uniform(0, 200)), rng.random() * math.pi * 2, 2 + rng.random() * 3)
+        sparks.update()
+        rects = sparks.render(surf, offset=(rng.randint(-20, 20), rng.randint(-20, 20)))
+        # the two paths keep the sparks in a different order
+        states.append((sorted(zip(*(list(getattr(sparks, name)[:len(sparks)]) for name in spark.COLUMNS))),
+                       sorted(tuple(rect) for rect in rects)))
+        if step == 100:
+            sparks.clear()
+    return states, pygame.image.tobytes(surf, 'RGB')
+
+
+def test_arrays_match_lists(monkeypatch):
+    arrays = run(1)
+    monkeypatch.setattr(spark, 'numpy', None)
+    assert run(1) == arrays
@@ -0,0 +1,64 @@
+import random
+
+import pygame
+
+from scripts.spatial import SpatialHash, EntityHash
+
+
+class Thing:
+    pass
+
+
+def random_rect(rng):
+    # negative coordinates and rects bigger than a cell included
+    return pygame.Rect(rng.randint(-300, 300), rng.randint(-300, 300), rng.randint(1, 80), rng.randint(1, 80))
+
+
+def random_hash(rng, cls, count=200):
+    index = cls(cell_size=32)
+    rects = {}  # item: rect, in insertion order
+    for i in range(count):
+        thing = Thing()
+        rects[thing] = random_rect(rng)
+        index.insert(thing, rects[thing])
+    return index, rects
+
+
+def test_query_rect_matches_brute_force():
+    rng = random.Random(1)
+    index, rects = random_hash(rng, SpatialHash)
+    for i in range(300):
+        area = random_rect(rng)
+        assert index.query_rect(area) == [item for item, rect in rects.items() if area.colliderect(rect)]
+
+
+def test_query_point_matches_brute_force():
+    rng = random.Random(2)
+    index, rects = random_hash(rng, SpatialHash)
+    for i in range(1000):
+        pos = (rng.uniform(-320, 400), rng.uniform(-320, 400))
+        assert index.query_point(pos) == [item for item, rect in rects.items() if rect.collidepoint(pos)]
+
+
+def test_moved_entities_match_brute_force():
+    rng = random.Random(3)
+    index, rects = random_hash(rng, EntityHash)
+    for step in range(50):
+        for item in rng.sample(list(rects), 60):
+            # mostly small steps inside a cell, sometimes a jump across several
+            rect = rects[item].move(rng.randint(-4, 4), rng.randint(-4, 4)) if rng.random() < 0.8 else random_rect(rng)
+            rects[item] = rect
+            index.move(item, rect)
+        for item in rng.sample(list(rects), 2):
+            index.remove(item)
+            del rects[item]
+        for i in range(20):
+            area = random_rect(rng)
+            assert index.query_rect(area) == [item for item, rect in rects.items() if area.colliderect(rect)]
+            pos = (rng.randint(-320, 400), rng.randint(-320, 400))
+            assert index.query_point(pos) == [item for item, rect in rects.items() if rect.collidepoint(pos)]
+    # no bucket keeps a removed or moved away item
+    for (bx, by), bucket in index.buckets.items():
+        cell = pygame.Rect(bx * 32, by * 32, 32, 32)
+        for item in bucket.values():
+            assert cell.colliderect(rects[item])